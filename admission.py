@@ -0,0 +1,220 @@
+"""
+Admission control cho /api/chat.
+
+Mỗi request chat có thể gọi tới 8 lượt Gemini + 8 lượt backend, nên cần chặn sớm trước khi vào agent:
+- Rate limit theo user (token bucket, key = token đã băm, lưu trong Redis → áp dụng chung cho mọi worker)
+- Giới hạn số request chạy đồng thời + hàng đợi có giới hạn
+- Ưu tiên check-in / thao tác ghi hơn các câu hỏi xem thông tin
+- Trả 429/503 kèm Retry-After ngay khi quá tải (không để latency tăng vô hạn)
+"""
+
+import os
+import math
+import time
+import heapq
+import asyncio
+import itertools
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+from redis_store import redis_client, hash_token
+
+load_dotenv()
+
+# 1. CẤU HÌNH
+
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", 10))                  # Số request tối đa dồn liền
+RATE_LIMIT_PER_MINUTE = float(os.getenv("RATE_LIMIT_PER_MINUTE", 12))      # Tốc độ nạp lại token
+MAX_CONCURRENT_CHATS = int(os.getenv("MAX_CONCURRENT_CHATS", 8))           # Số chat chạy song song / worker
+MAX_CHAT_QUEUE = int(os.getenv("MAX_CHAT_QUEUE", 32))                      # Số request chờ tối đa
+CHAT_QUEUE_TIMEOUT = float(os.getenv("CHAT_QUEUE_TIMEOUT", 10))            # Thời gian chờ tối đa (giây)
+
+PRIORITY_ACTION = 0   # Check-in, tạo/sửa/hủy lịch, phản hồi lời mời
+PRIORITY_BROWSE = 1   # Xem lịch, tra cứu, hỏi đáp
+PRIORITY_BATCH = 2    # Item của /api/chat/batch (chạy nền, nhường cho người dùng tương tác)
+
+BATCH_QUEUE_TIMEOUT = float(os.getenv("BATCH_QUEUE_TIMEOUT", 300))       # Tổng thời gian item batch được chờ (rate limit + slot)
+
+ACTION_KEYWORDS = (
+    "check-in", "checkin", "check in", "qr",
+    "đặt", "tạo", "book", "hủy", "huỷ", "sửa", "đổi", "dời", "cập nhật",
+    "chấp nhận", "từ chối", "accept", "decline", "cancel",
+)
+
+class AdmissionRejected(Exception):
+    """Request bị từ chối ở tầng admission (429 khi vượt rate limit, 503 khi quá tải)."""
+    def __init__(self, status_code: int, detail: str, retry_after: float):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = max(1, math.ceil(retry_after))
+
+def classify_priority(message: str) -> int:
+    """Phân loại thô theo từ khóa: thao tác ghi/check-in được ưu tiên hơn xem thông tin."""
+    text = (message or "").lower()
+    if any(k in text for k in ACTION_KEYWORDS):
+        return PRIORITY_ACTION
+    return PRIORITY_BROWSE
+
+# 2. TOKEN BUCKET (REDIS)
+
+# Script chạy nguyên tử trên Redis, dùng đồng hồ của Redis để mọi worker thấy cùng một thời gian.
+# Trả về {allowed, retry_after}.
+TOKEN_BUCKET_LUA = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local data = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(data[1]) or capacity
+local ts = tonumber(data[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local retry = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+  allowed = 1
+else
+  retry = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(retry)}
+"""
+
+class TokenBucketLimiter:
+    def __init__(self, burst: int, per_minute: float, client=None):
+        self.capacity = burst
+        self.rate = per_minute / 60.0
+        self.client = client
+        self._script = client.register_script(TOKEN_BUCKET_LUA) if client else None
+        # Fallback khi không có Redis: bucket cục bộ trong worker
+        self._local = {}
+
+    def _take_local(self, key: str):
+        now = time.monotonic()
+        tokens, ts = self._local.get(key, (self.capacity, now))
+        tokens = min(self.capacity, tokens + (now - ts) * self.rate)
+        if tokens >= 1:
+            self._local[key] = (tokens - 1, now)
+            return True, 0.0
+        self._local[key] = (tokens, now)
+        return False, (1 - tokens) / self.rate
+
+    def take(self, user_token: str):
+        """Lấy 1 token cho user. Trả về (allowed, retry_after_seconds)."""
+        key = f"ratelimit:chat:{hash_token(user_token)}"
+        if self._script:
+            try:
+                allowed, retry = self._script(keys=[key], args=[self.capacity, self.rate])
+                return bool(int(allowed)), float(retry)
+            except Exception as e:
+                print(f"[WARN] Rate limit via Redis failed, using local bucket: {e}")
+        return self._take_local(key)
+
+# 3. CONCURRENCY GATE (ƯU TIÊN + HÀNG ĐỢI CÓ GIỚI HẠN)
+
+class PriorityGate:
+    """
+    Semaphore có hàng đợi ưu tiên, giới hạn kích thước.
+    - Còn slot và không ai chờ → chạy ngay.
+    - Hàng đợi đầy → request ưu tiên cao đẩy request ưu tiên thấp nhất (mới nhất) ra; nếu không đẩy được thì từ chối.
+    - Chờ quá CHAT_QUEUE_TIMEOUT → từ chối (503).
+    """
+    def __init__(self, max_concurrent: int, max_queue: int, timeout: float):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.active = 0
+        self._waiters = []               # heap: (priority, seq, future)
+        self._seq = itertools.count()
+
+    def _saturated(self, detail: str) -> AdmissionRejected:
+        return AdmissionRejected(503, detail, self.timeout)
+
+    def _evict_for(self, priority: int) -> bool:
+        # Tìm waiter có độ ưu tiên thấp nhất, vào sau cùng
+        live = [w for w in self._waiters if not w[2].done()]
+        if not live:
+            return False
+        victim = max(live, key=lambda w: (w[0], w[1]))
+        if victim[0] <= priority:
+            return False
+        self._waiters.remove(victim)
+        heapq.heapify(self._waiters)
+        victim[2].set_exception(self._saturated("Hệ thống đang quá tải, vui lòng thử lại sau."))
+        return True
+
+    async def acquire(self, priority: int, timeout: float = None):
+        self._waiters = [w for w in self._waiters if not w[2].done()]
+        if self.active < self.max_concurrent and not self._waiters:
+            self.active += 1
+            return
+
+        if len(self._waiters) >= self.max_queue and not self._evict_for(priority):
+            raise self._saturated("Hệ thống đang quá tải, vui lòng thử lại sau.")
+
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), fut))
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), timeout=timeout or self.timeout)
+        except asyncio.TimeoutError:
+            if fut.done() and not fut.cancelled() and fut.exception() is None:
+                # Slot vừa được trao đúng lúc hết giờ → vẫn dùng được
+                return
+            fut.cancel()
+            raise self._saturated("Hết thời gian chờ xử lý, vui lòng thử lại sau.")
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled() and fut.exception() is None:
+                self.release()
+            fut.cancel()
+            raise
+
+    def release(self):
+        # Trao slot trực tiếp cho waiter ưu tiên cao nhất (active không đổi)
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                fut.set_result(True)
+                return
+        self.active -= 1
+
+# 4. ENTRY POINT CHO main.py
+
+rate_limiter = TokenBucketLimiter(RATE_LIMIT_BURST, RATE_LIMIT_PER_MINUTE, redis_client)
+chat_gate = PriorityGate(MAX_CONCURRENT_CHATS, MAX_CHAT_QUEUE, CHAT_QUEUE_TIMEOUT)
+
+@asynccontextmanager
+async def admit(user_token: str, message: str):
+    """Kiểm tra rate limit rồi chờ slot xử lý. Raise AdmissionRejected nếu bị từ chối."""
+    allowed, retry_after = rate_limiter.take(user_token)
+    if not allowed:
+        raise AdmissionRejected(429, "Bạn gửi quá nhiều yêu cầu, vui lòng chờ một chút.", retry_after)
+
+    await chat_gate.acquire(classify_priority(message))
+    try:
+        yield
+    finally:
+        chat_gate.release()
+
+@asynccontextmanager
+async def admit_batch_item(user_token: str):
+    """
+    Slot cho một item batch: trừ vào cùng token bucket của user như /api/chat (batch không phải đường vòng
+    qua rate limit), dùng chung concurrency gate với độ ưu tiên thấp nhất.
+    Batch chạy nền, cần thông lượng hơn latency: bucket hết → chờ nạp lại thay vì trả 429 ngay;
+    chỉ từ chối khi tổng thời gian chờ vượt BATCH_QUEUE_TIMEOUT.
+    """
+    deadline = time.monotonic() + BATCH_QUEUE_TIMEOUT
+    while True:
+        allowed, retry_after = rate_limiter.take(user_token)
+        if allowed:
+            break
+        if time.monotonic() + retry_after > deadline:
+            raise AdmissionRejected(429, "Người dùng này gửi quá nhiều yêu cầu, vui lòng chờ một chút.", retry_after)
+        await asyncio.sleep(retry_after)
+
+    await chat_gate.acquire(PRIORITY_BATCH, timeout=max(deadline - time.monotonic(), 0.01))
+    try:
+        yield
+    finally:
+        chat_gate.release()
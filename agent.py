@@ -1,9 +1,18 @@
 import google.generativeai as genai
 import os
 import json
-import redis
+import uuid
+import asyncio
 from dotenv import load_dotenv
 from tools import available_tools
+from redis_store import redis_client
+from write_queue import WRITE_TOOLS, enqueue_write, drain_write_outcomes
+import prefetch
+import batch
+import live_view
+from recurrence import precheck_series, RECURRENCE_ROOM_CHECKS
+from tools import fetch_all_my_meetings, is_room_available
+from model_router import ModelRouter, classify_complexity, STAGE_PLANNER, STAGE_SUMMARIZER, STAGE_COMPACTION, COMPLEXITY_COMPLEX, MODEL_BACKEND
 from datetime import datetime
 
 # Google Generative AI Low-level imports
@@ -12,29 +21,15 @@ from google.ai.generativelanguage import Content, Part, FunctionResponse
 
 # 1. Configuration
 load_dotenv()
-api_key = os.getenv("GEMINI_API_KEY")
-if not api_key:
-    raise ValueError("Missing GEMINI_API_KEY in .env file")
-
-genai.configure(api_key=api_key)
-
-# 2. Redis Connection
-redis_host = os.getenv("REDIS_HOST", "localhost")
-redis_port = int(os.getenv("REDIS_PORT", 6379))
-redis_password = os.getenv("REDIS_PASSWORD")
-redis_db = int(os.getenv("REDIS_DB", 0))
-if redis_password == "": redis_password = None
-
-try:
-    redis_client = redis.Redis(
-        host=redis_host, port=redis_port, password=redis_password, db=redis_db,
-        decode_responses=True, socket_connect_timeout=5
-    )
-    redis_client.ping()
-    print(f"[INFO] Redis connected: {redis_host}:{redis_port}")
-except Exception as e:
-    print(f"[ERROR] Redis connection failed: {e}")
-    redis_client = None
+# MODEL_BACKEND=local: model giả lập, không cần API key (xem model_router.py)
+if MODEL_BACKEND != "local":
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        raise ValueError("Missing GEMINI_API_KEY in .env file")
+
+    genai.configure(api_key=api_key)
+
+# 2. Redis Connection (dùng chung, xem redis_store.py)
 
 # 3. SCHEMA DEFINITIONS (Định nghĩa cấu trúc dữ liệu chuẩn)
 
@@ -181,7 +176,8 @@ tools_list = [
 ]
 
 meeting_tools = Tool(function_declarations=tools_list)
-model = genai.GenerativeModel(model_name='models/gemini-2.5-flash', tools=[meeting_tools])
+# Model theo từng stage (planner / summarizer / compaction), cấu hình trong .env - xem model_router.py
+router = ModelRouter(tools=[meeting_tools])
 
 # 5. REDIS LOGIC
 def get_chat_history(user_token: str):
@@ -208,10 +204,87 @@ def save_chat_turn(user_token: str, user_msg: str, bot_msg: str):
         redis_client.expire(key, 1800) 
     except: pass
 
+_background_tasks = set()   # Giữ tham chiếu tới task chạy nền để không bị GC khi đang chạy
+
+HISTORY_COMPACT_AT = int(os.getenv("HISTORY_COMPACT_AT", 16))   # Số message trước khi nén lịch sử
+HISTORY_KEEP_RECENT = int(os.getenv("HISTORY_KEEP_RECENT", 6))  # Số message gần nhất giữ nguyên văn
+
+def compact_chat_history(user_token: str):
+    """Nén các lượt cũ thành một đoạn tóm tắt bằng model compaction (rẻ), giữ nguyên các lượt gần nhất."""
+    if not redis_client: return
+    key = f"chat_history:{user_token}"
+    try:
+        data = redis_client.get(key)
+        hist = json.loads(data) if data else []
+        if len(hist) < HISTORY_COMPACT_AT: return
+
+        old, recent = hist[:-HISTORY_KEEP_RECENT], hist[-HISTORY_KEEP_RECENT:]
+        transcript = "\n".join(f"{i['role']}: {i['text']}" for i in old)
+        prompt = (
+            "Tóm tắt ngắn gọn hội thoại sau giữa user và trợ lý đặt lịch họp. "
+            "Giữ lại các ID (phòng, cuộc họp, seriesId, người dùng), thời gian và quyết định đã chốt.\n\n" + transcript
+        )
+        summary = router.model_for(STAGE_COMPACTION).generate_content(prompt).text
+        compacted = [
+            {"role": "user", "text": "[Tóm tắt hội thoại trước đó]"},
+            {"role": "model", "text": summary},
+        ] + recent
+
+        # Chỉ ghi nếu lịch sử không đổi trong lúc tóm tắt (tránh mất lượt chat mới)
+        with redis_client.pipeline() as pipe:
+            pipe.watch(key)
+            if pipe.get(key) != data: return
+            pipe.multi()
+            pipe.set(key, json.dumps(compacted))
+            pipe.expire(key, 1800)
+            pipe.execute()
+    except Exception as e:
+        print(f"[WARN] History compaction failed: {e}")
+
+async def precheck_recurring_write(user_token: str, fname: str, call_args: dict):
+    """
+    Kiểm tra rule + trùng lịch của chuỗi định kỳ trước khi ghi xuống backend.
+    Trả None, {"error": ...} (chặn) hoặc {"warning": ...} (vẫn ghi) - xem recurrence.precheck_series.
+    """
+    if fname not in ("create_meeting", "update_meeting_series") or not call_args.get("recurrence"):
+        return None
+    # Lịch đã có sẵn (live view / snapshot prefetch) trước; chỉ duyệt hết các trang khi cả hai đều cold
+    meetings = await asyncio.to_thread(live_view.read_view, user_token, live_view.MEETINGS)
+    if meetings is None and prefetch.PREFETCH_ENABLED:
+        snapshot = await prefetch.get_snapshot(user_token, wait=prefetch.PREFETCH_DIGEST_WAIT)
+        meetings = (snapshot or {}).get("get_my_meetings")
+    if meetings is None:
+        meetings = await asyncio.to_thread(fetch_all_my_meetings, user_token)
+    if not isinstance(meetings, list):
+        meetings = []
+    room_id = call_args.get("room_id")
+    room_available = None
+    if fname == "create_meeting" and room_id is not None and RECURRENCE_ROOM_CHECKS > 0:
+        # Sửa chuỗi: phòng đang bị chính chuỗi đó chiếm → chỉ dựa vào lịch đã cache
+        room_available = lambda start, end: is_room_available(user_token, room_id, start, end)
+    return await asyncio.to_thread(
+        precheck_series,
+        call_args["recurrence"], call_args.get("start_time"), call_args.get("end_time"), meetings,
+        room_id=room_id, participant_ids=call_args.get("participant_ids"),
+        exclude_series_id=call_args.get("series_id"), room_available=room_available
+    )
+
 # 6. MAIN CHAT LOGIC (QUAN TRỌNG: ĐÃ THÊM LOGIC SỬA LỖI REPEATEDCOMPOSITE)
-async def simple_chat(user_message: str, user_token: str):
-    history = get_chat_history(user_token)
-    chat = model.start_chat(history=history, enable_automatic_function_calling=False)
+async def simple_chat(user_message: str, user_token: str, idempotency_key: str = None):
+    # Item batch là tin nhắn tự động một lượt: không đọc / ghi lịch sử chat và không lấy
+    # kết quả thao tác ghi đang chờ của user (để user vẫn thấy chúng trong phiên chat của mình)
+    in_batch = batch.in_batch()
+    history = [] if in_batch else get_chat_history(user_token)
+    complexity = classify_complexity(user_message)
+    # Scope idempotency key của các thao tác ghi trong lượt này: client gửi lại request (cùng
+    # Idempotency-Key) → cùng scope → không ghi trùng. Không có header → mỗi lượt là một scope mới
+    turn_id = f"client:{idempotency_key}" if idempotency_key else uuid.uuid4().hex
+    chat = router.start_chat(STAGE_PLANNER, complexity, history)
+
+    # Tin nhắn đầu phiên → tải trước lịch họp / thông báo / phòng ở background
+    # (Bỏ qua với item batch: message tự động một lượt, dữ liệu tham chiếu đã dùng chung trong batch)
+    if not history and not in_batch:
+        prefetch.start_prefetch(user_token)
     
     now = datetime.now()
     current_time_str = now.strftime('%Y-%m-%d %H:%M:%S')
@@ -240,11 +313,34 @@ async def simple_chat(user_message: str, user_token: str):
        - Nếu user nói tên phòng (vd: "phòng sao hỏa"), BẮT BUỘC phải gọi `get_rooms` để tìm ID của nó trước.
        - Không được tự ý điền ID bừa bãi (vd: ID=1) nếu chưa xác nhận.
        
-    4. **PHẢN HỒI:** Ngắn gọn, súc tích.
+    4. **THAO TÁC GHI (tạo/sửa/hủy lịch):**
+       - Kết quả có `status`: "confirmed" = đã xong, "failed" = lỗi, "queued" = đang xử lý.
+       - Nếu "queued": báo user yêu cầu đang được xử lý và sẽ có thông báo khi hoàn tất. KHÔNG gọi lại cùng thao tác.
+       - Nếu có `precheck_warning`: lịch vẫn được gửi đi, nhưng hãy báo user các buổi trùng với lịch hiện có của họ.
+
+    5. **PHẢN HỒI:** Ngắn gọn, súc tích.
+    """
+
+    if prefetch.PREFETCH_DIGEST:
+        digest = prefetch.build_digest(await prefetch.get_snapshot(user_token, wait=prefetch.PREFETCH_DIGEST_WAIT), now)
+        if digest:
+            system_instruction += f"""
+    [DỮ LIỆU SẴN CÓ CỦA USER - dùng trực tiếp, không cần gọi tool lại]
+    {digest}
+    """
+
+    # Kết quả các thao tác ghi đã xử lý xong kể từ lượt trước → để trợ lý báo lại cho user
+    write_outcomes = None if in_batch else drain_write_outcomes(user_token)
+    if write_outcomes:
+        outcomes_json = json.dumps(write_outcomes, ensure_ascii=False, default=str)
+        system_instruction += f"""
+    [KẾT QUẢ THAO TÁC TRƯỚC ĐÓ - hãy thông báo ngắn gọn cho user ở đầu câu trả lời]
+    {outcomes_json}
     """
 
     try:
-        response = chat.send_message(f"{system_instruction}\nUser: {user_message}")
+        # Chạy lời gọi Gemini (blocking) trong thread để không chặn event loop của các request khác
+        response = await asyncio.to_thread(chat.send_message, f"{system_instruction}\nUser: {user_message}")
     except Exception as e:
         print(f"❌ Error Gemini: {e}")
         return "Hệ thống AI đang bận. Vui lòng thử lại sau."
@@ -257,7 +353,13 @@ async def simple_chat(user_message: str, user_token: str):
         
         if not part.function_call:
             bot_reply = response.text
+            if in_batch:
+                return bot_reply
             save_chat_turn(user_token, user_message, bot_reply)
+            if len(history) + 2 >= HISTORY_COMPACT_AT:
+                task = asyncio.create_task(asyncio.to_thread(compact_chat_history, user_token))
+                _background_tasks.add(task)
+                task.add_done_callback(_background_tasks.discard)
             return bot_reply
 
         fc = part.function_call
@@ -294,7 +396,27 @@ async def simple_chat(user_message: str, user_token: str):
                     else:
                         call_args[key] = value
                 
-                result = func(**call_args)
+                prefetched, cached_result = await prefetch.serve(user_token, fname, call_args)
+                if not prefetched:
+                    prefetched, cached_result = await batch.serve_shared(fname, call_args)
+                precheck = None if prefetched else await precheck_recurring_write(user_token, fname, call_args)
+                precheck_error = precheck if precheck and "error" in precheck else None
+                if prefetched:
+                    result = cached_result
+                elif precheck_error:
+                    # Rule sai hoặc trùng lịch → trả ngay cho model, không gửi xuống backend
+                    result = precheck_error
+                elif fname in WRITE_TOOLS:
+                    # Thao tác ghi đi qua hàng đợi (idempotent), không chờ backend trong vòng lặp LLM
+                    result = await asyncio.to_thread(enqueue_write, fname, call_args, turn_id)
+                else:
+                    result = await asyncio.to_thread(func, **call_args)
+                if precheck and not precheck_error and isinstance(result, dict):
+                    # Chỉ trùng với lịch của chính user → đã ghi, kèm cảnh báo để model báo lại
+                    result["precheck_warning"] = precheck
+                if not precheck_error and fname in prefetch.INVALIDATING_TOOLS:
+                    prefetch.invalidate(user_token, fname)
+                    live_view.invalidate(user_token)
             else:
                 result = {"error": f"Tool {fname} không tồn tại."}
         except Exception as e:
@@ -302,7 +424,14 @@ async def simple_chat(user_message: str, user_token: str):
 
         print(f"✅ [API Result] {result}")
 
-        response = chat.send_message(
+        # Lượt sau tool: yêu cầu đơn giản → model rẻ diễn đạt kết quả.
+        # Nếu model đó vẫn cần gọi thêm tool (turn > 0) → nâng lên planner cho các lượt còn lại.
+        if turn > 0:
+            complexity = COMPLEXITY_COMPLEX
+        chat = router.switch_chat(chat, STAGE_SUMMARIZER, complexity)
+
+        response = await asyncio.to_thread(
+            chat.send_message,
             Content(parts=[Part(function_response=FunctionResponse(name=fname, response={"result": result}))])
         )
         turn += 1
@@ -0,0 +1,113 @@
+"""
+Batch chat cho client tự động (assistant chạy theo lịch của backend Java, import đặt phòng hàng loạt...).
+
+- Nhận N message, mỗi message có token riêng, chạy song song có giới hạn (BATCH_CONCURRENCY)
+- Dữ liệu tham chiếu (danh sách phòng, thiết bị) chỉ tải một lần cho cả batch, các item dùng chung
+  (truyền qua ContextVar nên tools/agent không cần đổi chữ ký hàm)
+- Kết quả trả về từng item ngay khi xong (NDJSON stream); item lỗi không chặn các item khác
+- Chỉ dành cho service nội bộ: bắt buộc header X-Batch-Secret = BATCH_API_SECRET (chưa cấu hình → tắt endpoint);
+  mỗi item vẫn bị tính vào rate limit của user sở hữu token
+"""
+
+import os
+import hmac
+import json
+import asyncio
+import threading
+from contextvars import ContextVar
+from dotenv import load_dotenv
+from admission import admit_batch_item, AdmissionRejected
+from tools import get_rooms, get_devices
+
+load_dotenv()
+
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", 100))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 4))
+BATCH_API_SECRET = os.getenv("BATCH_API_SECRET", "")
+
+# Tool → hàm lấy dữ liệu tham chiếu dùng chung (không phụ thuộc user)
+SHARED_SOURCES = {
+    "get_rooms": get_rooms,
+    "get_devices": get_devices,
+}
+
+class BatchSharedData:
+    """Dữ liệu tham chiếu tải lười, một lần cho cả batch."""
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+        self._loading = {}
+
+    def get(self, fname: str, token: str):
+        with self._lock:
+            if fname in self._values:
+                return self._values[fname]
+            event = self._loading.get(fname)
+            owner = event is None
+            if owner:
+                event = self._loading[fname] = threading.Event()
+        if not owner:
+            # Item khác đang tải → chờ dùng chung kết quả
+            event.wait()
+            with self._lock:
+                if fname in self._values:
+                    return self._values[fname]
+            return SHARED_SOURCES[fname](token)
+
+        try:
+            result = SHARED_SOURCES[fname](token)
+            if not (isinstance(result, dict) and "error" in result):
+                with self._lock:
+                    self._values[fname] = result
+            return result
+        finally:
+            with self._lock:
+                self._loading.pop(fname, None)
+            event.set()
+
+def verify_batch_secret(secret: str) -> bool:
+    """Fail closed: chưa cấu hình BATCH_API_SECRET thì không ai gọi được."""
+    if not BATCH_API_SECRET:
+        return False
+    return hmac.compare_digest(secret or "", BATCH_API_SECRET)
+
+current_batch: ContextVar = ContextVar("current_batch", default=None)
+
+def in_batch() -> bool:
+    return current_batch.get() is not None
+
+async def serve_shared(fname: str, call_args: dict):
+    """Trả (True, result) nếu tool call thuộc dữ liệu dùng chung của batch hiện tại."""
+    shared = current_batch.get()
+    if shared is None or fname not in SHARED_SOURCES:
+        return False, None
+    return True, await asyncio.to_thread(shared.get, fname, call_args["token"])
+
+async def run_batch(items: list, chat_fn, concurrency: int = BATCH_CONCURRENCY):
+    """
+    Chạy các item {"id", "message", "token"} song song (tối đa `concurrency`),
+    yield từng dòng NDJSON theo thứ tự hoàn thành.
+    """
+    semaphore = asyncio.Semaphore(max(1, min(concurrency, BATCH_CONCURRENCY)))
+    shared = BatchSharedData()
+
+    async def run_item(index: int, item: dict):
+        current_batch.set(shared)   # Mỗi task có context riêng → chỉ ảnh hưởng item này
+        result = {"index": index, "id": item.get("id")}
+        async with semaphore:
+            try:
+                async with admit_batch_item(item["token"]):
+                    result["reply"] = await chat_fn(item["message"], item["token"])
+            except AdmissionRejected as e:
+                result.update(error=e.detail, status_code=e.status_code, retry_after=e.retry_after)
+            except Exception as e:
+                result["error"] = str(e)
+        return result
+
+    tasks = [asyncio.create_task(run_item(i, item)) for i, item in enumerate(items)]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            yield json.dumps(await finished, ensure_ascii=False) + "\n"
+    finally:
+        for t in tasks:
+            t.cancel()
@@ -0,0 +1,208 @@
+"""
+Benchmark tra cứu chính sách: Chroma PersistentClient vs NumPy mmap index (vector_index.py).
+
+Đo cho từng backend (mỗi backend chạy trong một process riêng để RSS không lẫn nhau):
+- Thời gian import + mở index
+- Latency query (p50 / p95) cho 1 query và cho batch nhiều query
+- RSS của process sau khi load và sau khi query
+- Với --workers N: N process cùng mở index và query song song, đo tổng RSS và tổng PSS
+  (PSS chia đều các trang dùng chung cho các process → thấy được mmap có thật sự được chia sẻ không)
+
+Chỉ đo phần retrieval: vector query là vector ngẫu nhiên cùng số chiều (không gọi API embedding).
+Yêu cầu: đã chạy ingest.py (có ./chroma_db và ./vector_index).
+
+Chạy: python bench_policy.py [--queries 500] [--batch 16] [--workers 4]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+CHROMA_DB_PATH = "./chroma_db"
+COLLECTION_NAME = "meeting_policies"
+VECTOR_INDEX_PATH = os.getenv("VECTOR_INDEX_PATH", "./vector_index")
+
+
+
+# 1. ĐO TRONG PROCESS CON
+
+def _rss_mb() -> float:
+    """RSS hiện tại (MB), đọc từ /proc (Linux). Fallback: ru_maxrss."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _pss_mb():
+    """PSS hiện tại (MB) từ /proc/self/smaps_rollup (Linux ≥ 4.14), None nếu không đọc được."""
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def _open_backend(backend: str):
+    if backend == "chroma":
+        import chromadb
+        client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
+        collection = client.get_collection(COLLECTION_NAME)
+        dim = len(collection.peek(1)["embeddings"][0])
+        return collection, dim
+    from vector_index import NumpyVectorIndex
+    index = NumpyVectorIndex(VECTOR_INDEX_PATH)
+    return index, index.matrix.shape[1]
+
+def run_single_backend(backend: str, n_queries: int, batch: int) -> dict:
+    rss_start = _rss_mb()
+    t0 = time.perf_counter()
+    index, dim = _open_backend(backend)
+    open_ms = (time.perf_counter() - t0) * 1000
+    rss_loaded = _rss_mb()
+
+    import numpy as np
+    rng = np.random.default_rng(0)
+    queries = rng.standard_normal((n_queries, dim)).astype(np.float32)
+
+    single = []
+    for q in queries:
+        t = time.perf_counter()
+        index.query(query_embeddings=[q.tolist()], n_results=2)
+        single.append((time.perf_counter() - t) * 1000)
+
+    batched = []
+    for start in range(0, n_queries, batch):
+        chunk = queries[start:start + batch]
+        t = time.perf_counter()
+        index.query(query_embeddings=chunk.tolist(), n_results=2)
+        batched.append((time.perf_counter() - t) * 1000 / len(chunk))
+
+    return {
+        "backend": backend,
+        "open_ms": round(open_ms, 2),
+        "single_p50_ms": round(_percentile(single, 50), 4),
+        "single_p95_ms": round(_percentile(single, 95), 4),
+        "batched_per_query_ms": round(sum(batched) / len(batched), 4),
+        "rss_start_mb": round(rss_start, 1),
+        "rss_loaded_mb": round(rss_loaded, 1),
+        "rss_after_mb": round(_rss_mb(), 1),
+    }
+
+def run_held_worker(backend: str, n_queries: int, batch: int) -> None:
+    """
+    Process con của chế độ --workers: chạy benchmark, báo READY rồi chờ lệnh đo từ process cha
+    (đo khi tất cả worker còn sống để PSS phản ánh đúng phần bộ nhớ dùng chung), sau đó chờ lệnh thoát.
+    """
+    result = run_single_backend(backend, n_queries, batch)
+    print("READY", flush=True)
+    sys.stdin.readline()
+    result.update(rss_held_mb=round(_rss_mb(), 1), pss_held_mb=_pss_mb())
+    print(json.dumps(result), flush=True)
+    sys.stdin.readline()
+
+
+
+# 2. CHẠY & IN KẾT QUẢ
+
+def _child_args(backend: str, args, mode: str):
+    return [sys.executable, __file__, mode, backend, "--queries", str(args.queries), "--batch", str(args.batch)]
+
+def _run_single(backend: str, args):
+    proc = subprocess.run(_child_args(backend, args, "--backend"), capture_output=True, text=True)
+    if proc.returncode != 0:
+        print(f"[WARN] {backend} benchmark failed:\n{proc.stderr.strip()}")
+        return None
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+def _run_workers(backend: str, args):
+    """N process cùng backend chạy đồng thời; tổng PSS thấp hơn nhiều so với tổng RSS ⇒ index được chia sẻ."""
+    procs = [
+        subprocess.Popen(_child_args(backend, args, "--hold"), stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                         stderr=subprocess.PIPE, text=True)
+        for _ in range(args.workers)
+    ]
+    try:
+        for proc in procs:
+            while True:
+                line = proc.stdout.readline()
+                if not line:
+                    raise RuntimeError(proc.stderr.read().strip())
+                if line.strip() == "READY":
+                    break
+        results = []
+        for proc in procs:
+            proc.stdin.write("measure\n")
+            proc.stdin.flush()
+        for proc in procs:
+            results.append(json.loads(proc.stdout.readline()))
+    except (RuntimeError, ValueError) as e:
+        print(f"[WARN] {backend} multi-worker benchmark failed:\n{e}")
+        return None
+    finally:
+        for proc in procs:
+            try:
+                proc.stdin.close()
+            except OSError:
+                pass
+            proc.wait(timeout=30)
+
+    pss = [r["pss_held_mb"] for r in results]
+    return {
+        "backend": backend,
+        "workers": len(results),
+        "open_ms_max": max(r["open_ms"] for r in results),
+        "single_p50_ms_max": max(r["single_p50_ms"] for r in results),
+        "total_rss_mb": round(sum(r["rss_held_mb"] for r in results), 1),
+        "total_pss_mb": round(sum(pss), 1) if None not in pss else "n/a",
+    }
+
+def _print_table(rows: list) -> None:
+    if not rows:
+        return
+    columns = list(rows[0].keys())
+    print(" | ".join(c.ljust(20) for c in columns))
+    print("-" * (23 * len(columns)))
+    for row in rows:
+        print(" | ".join(str(row[c]).ljust(20) for c in columns))
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark policy search backends")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--batch", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=0, help="Đo thêm N process chạy đồng thời (RSS/PSS tổng)")
+    parser.add_argument("--backend", choices=["chroma", "numpy"], help=argparse.SUPPRESS)
+    parser.add_argument("--hold", choices=["chroma", "numpy"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.backend:
+        print(json.dumps(run_single_backend(args.backend, args.queries, args.batch)))
+        return
+    if args.hold:
+        run_held_worker(args.hold, args.queries, args.batch)
+        return
+
+    _print_table([row for row in (_run_single(b, args) for b in ("chroma", "numpy")) if row])
+    if args.workers > 1:
+        print()
+        _print_table([row for row in (_run_workers(b, args) for b in ("chroma", "numpy")) if row])
+
+
+
+# 3. ENTRY POINT
+
+if __name__ == "__main__":
+    main()
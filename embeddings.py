@@ -0,0 +1,175 @@
+"""
+Embedding providers dùng chung cho ingest.py và tools.search_policy.
+
+EMBEDDING_PROVIDER:
+- gemini  (mặc định): models/text-embedding-004 qua API (mỗi query tốn một round trip mạng)
+- onnx    : model ONNX chạy CPU bằng onnxruntime + tokenizers, batch + thread pool
+            (EMBEDDING_MODEL_PATH, EMBEDDING_TOKENIZER_PATH)
+- hashing : feature hashing tất định, không cần mạng/model — dùng cho dev/test offline
+
+Mỗi provider có `name` duy nhất (gồm cả model/tham số). ingest.py ghi name này vào metadata của
+collection / index; lúc query, tools.py so khớp để đảm bảo ingest và query dùng cùng một provider.
+"""
+
+import os
+import re
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+from dotenv import load_dotenv
+
+load_dotenv()
+
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "gemini").lower()
+GEMINI_EMBEDDING_MODEL = os.getenv("GEMINI_EMBEDDING_MODEL", "models/text-embedding-004")
+EMBEDDING_MODEL_PATH = os.getenv("EMBEDDING_MODEL_PATH", "./models/embedding/model.onnx")
+EMBEDDING_TOKENIZER_PATH = os.getenv("EMBEDDING_TOKENIZER_PATH")   # Mặc định: tokenizer.json cạnh model
+EMBEDDING_MAX_TOKENS = int(os.getenv("EMBEDDING_MAX_TOKENS", 256))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 16))
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", 2))
+HASHING_DIM = int(os.getenv("HASHING_EMBEDDING_DIM", 384))
+
+METADATA_KEY = "embedding_provider"
+
+class EmbeddingProvider:
+    name = "base"
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        raise NotImplementedError
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+# 1. GEMINI (REMOTE)
+
+class GeminiEmbeddingProvider(EmbeddingProvider):
+    def __init__(self, model: str = GEMINI_EMBEDDING_MODEL):
+        import google.generativeai as genai
+        if os.getenv("GEMINI_API_KEY"):
+            genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+        self._genai = genai
+        self.model = model
+        self.name = f"gemini:{model}"
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        result = self._genai.embed_content(
+            model=self.model,
+            content=[t.strip() for t in texts],
+            task_type="retrieval_document",    # Tối ưu cho việc lưu tài liệu
+        )
+        return result["embedding"]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._genai.embed_content(
+            model=self.model,
+            content=text,
+            task_type="retrieval_query"
+        )["embedding"]
+
+# 2. ONNX (LOCAL CPU)
+
+class OnnxEmbeddingProvider(EmbeddingProvider):
+    """
+    Model sentence-embedding dạng ONNX (vd: xuất từ sentence-transformers).
+    Mean pooling theo attention_mask rồi chuẩn hóa L2.
+    """
+    def __init__(self, model_path: str = EMBEDDING_MODEL_PATH, tokenizer_path: str = None,
+                 max_tokens: int = EMBEDDING_MAX_TOKENS, batch_size: int = EMBEDDING_BATCH_SIZE,
+                 threads: int = EMBEDDING_THREADS):
+        import numpy as np
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self._np = np
+        tokenizer_path = tokenizer_path or EMBEDDING_TOKENIZER_PATH or os.path.join(os.path.dirname(model_path), "tokenizer.json")
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.enable_truncation(max_length=max_tokens)
+        self.tokenizer.enable_padding()
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = max(1, (os.cpu_count() or 2) // max(1, threads))
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.batch_size = batch_size
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="onnx-embed")
+        # Thư mục + tên file: các model export thường đều tên model.onnx
+        model_id = "/".join(os.path.normpath(model_path).split(os.sep)[-2:])
+        self.name = f"onnx:{model_id}:{max_tokens}"
+
+    def _embed_batch(self, texts: List[str]):
+        np = self._np
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+        feeds = {k: v for k, v in feeds.items() if k in self.input_names}
+
+        hidden = self.session.run(None, feeds)[0]          # (batch, seq, dim) hoặc (batch, dim)
+        if hidden.ndim == 3:
+            mask = attention_mask[:, :, None].astype(hidden.dtype)
+            hidden = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(hidden, axis=1, keepdims=True)
+        return (hidden / np.clip(norms, 1e-12, None)).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        results = []
+        for vectors in self.pool.map(self._embed_batch, batches):
+            results.extend(vectors)
+        return results
+
+# 3. HASHING (OFFLINE / TEST)
+
+_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+class HashingEmbeddingProvider(EmbeddingProvider):
+    """Feature hashing unigram + bigram (có dấu ±), tất định giữa các process (dùng md5, không dùng hash())."""
+    def __init__(self, dim: int = HASHING_DIM):
+        import numpy as np
+        self._np = np
+        self.dim = dim
+        self.name = f"hashing:{dim}"
+
+    def _features(self, text: str):
+        tokens = _TOKEN_PATTERN.findall(text.lower())
+        return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+    def _embed_one(self, text: str):
+        np = self._np
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature in self._features(text):
+            digest = hashlib.md5(feature.encode("utf-8")).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dim
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed_one(t) for t in texts]
+
+# 4. FACTORY
+
+_provider = None
+_provider_lock = threading.Lock()
+
+def create_provider(kind: str = None) -> EmbeddingProvider:
+    kind = (kind or EMBEDDING_PROVIDER).lower()
+    if kind == "onnx":
+        return OnnxEmbeddingProvider()
+    if kind == "hashing":
+        return HashingEmbeddingProvider()
+    if kind == "gemini":
+        return GeminiEmbeddingProvider()
+    raise ValueError(f"EMBEDDING_PROVIDER không hợp lệ: {kind}. Chỉ chấp nhận gemini | onnx | hashing")
+
+def get_provider() -> EmbeddingProvider:
+    """Provider dùng chung trong process (khởi tạo một lần)."""
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                _provider = create_provider()
+    return _provider
@@ -2,11 +2,13 @@
 Ingest script: Nạp tài liệu chính sách họp nội bộ vào ChromaDB để phục vụ RAG (Retrieval-Augmented Generation)
 
 Yêu cầu:
-- File data/policy.txt tồn tại và chứa nội dung quy định (mỗi đoạn cách nhau bằng dòng trống)
-- GEMINI_API_KEY được đặt trong file .env
+- File data/policy.txt tồn tại và chứa nội dung quy định (mỗi đoạn cách nhau bằng dòng trống,
+  tiêu đề phần viết HOA, vd: "PHẦN 1: ...")
+- GEMINI_API_KEY được đặt trong file .env (khi EMBEDDING_PROVIDER=gemini, xem embeddings.py)
 - Chạy script này mỗi khi cập nhật chính sách mới
 
 Sau khi chạy xong → có thể dùng trong tools/search_policy.py
+Ngoài ChromaDB, script cũng xuất index NumPy (VECTOR_INDEX_PATH) cho POLICY_BACKEND=numpy.
 """
 
 import os
@@ -14,6 +16,9 @@ import chromadb
 import google.generativeai as genai
 from dotenv import load_dotenv
 from typing import List
+from rag import count_tokens, chunk_text
+from vector_index import export_index
+from embeddings import get_provider, METADATA_KEY, EMBEDDING_PROVIDER, EMBEDDING_BATCH_SIZE
 
 
 
@@ -22,10 +27,13 @@ from typing import List
 load_dotenv()
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
+if GEMINI_API_KEY:
+    genai.configure(api_key=GEMINI_API_KEY)
+elif EMBEDDING_PROVIDER == "gemini":
     raise ValueError("GEMINI_API_KEY không được tìm thấy trong file .env")
 
-genai.configure(api_key=GEMINI_API_KEY)
+# Provider embedding (phải trùng với provider lúc query trong tools.py)
+embedding_provider = get_provider()
 
 
 
@@ -33,6 +41,9 @@ genai.configure(api_key=GEMINI_API_KEY)
 
 CHROMA_DB_PATH = "./chroma_db"
 COLLECTION_NAME = "meeting_policies"
+VECTOR_INDEX_PATH = os.getenv("VECTOR_INDEX_PATH", "./vector_index")
+VECTOR_INDEX_DTYPE = os.getenv("VECTOR_INDEX_DTYPE", "float16")   # float16 (nhỏ gọn) hoặc float32
+
 
 chroma_client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
 
@@ -45,36 +56,36 @@ except Exception:
     pass
 
 # Tạo collection mới (hoặc lấy lại nếu đã có)
-collection = chroma_client.get_or_create_collection(name=COLLECTION_NAME)
-print(f"Collection '{COLLECTION_NAME}' đã sẵn sàng tại {CHROMA_DB_PATH}")
+# Ghi lại provider đã dùng để tools.py kiểm tra khi query; khoảng cách cosine (giống index NumPy)
+# để rag.select_context lọc theo cùng một ngưỡng độ tương đồng
+collection = chroma_client.get_or_create_collection(
+    name=COLLECTION_NAME,
+    metadata={METADATA_KEY: embedding_provider.name, "hnsw:space": "cosine"}
+)
+print(f"Collection '{COLLECTION_NAME}' đã sẵn sàng tại {CHROMA_DB_PATH} (embedding: {embedding_provider.name})")
 
 
 
 # 3. HÀM TẠO EMBEDDING
 
-def get_embedding(text: str) -> List[float]:
+def get_embeddings(texts: List[str]) -> List[List[float]]:
     """
-    Chuyển đổi đoạn văn bản thành vector embedding sử dụng Gemini text-embedding-004.
+    Chuyển đổi danh sách đoạn văn bản thành vector embedding bằng provider đã cấu hình (batch).
     
     Args:
-        text: Đoạn văn bản cần embedding (nên < 8192 tokens)
+        texts: Các đoạn văn bản cần embedding
     
     Returns:
-        List[float]: Vector 768 chiều
+        List[List[float]]: Mỗi đoạn một vector (số chiều tùy provider)
     """
     try:
-        result = genai.embed_content(
-            model="models/text-embedding-004",
-            content=text.strip(),
-            task_type="retrieval_document",    # Tối ưu cho việc lưu tài liệu
-        )
-        return result["embedding"]
+        return embedding_provider.embed_documents(texts)
     except Exception as exc:
         raise RuntimeError(f"Lỗi khi tạo embedding: {exc}")
 
 
 
-# 4. CHUNKING & INGESTION LOGIC
+# 4. INGESTION LOGIC (chia chunk: rag.chunk_text)
 
 def ingest_policy_documents(source_file: str = "data/policy.txt") -> None:
     """
@@ -92,26 +103,31 @@ def ingest_policy_documents(source_file: str = "data/policy.txt") -> None:
     if not raw_text.strip():
         raise ValueError(f"File {source_file} rỗng hoặc không có nội dung hợp lệ.")
 
-    # Chia nhỏ theo đoạn trống (paragraph-based chunking)
-    # Cách này giữ nguyên ngữ nghĩa tốt hơn so với chia theo số ký tự
-    chunks = [chunk.strip() for chunk in raw_text.split("\n\n") if chunk.strip()]
+    # Chia theo đoạn nhưng giới hạn theo token (có overlap), xem chunk_text
+    chunks = chunk_text(raw_text)
     
     if not chunks:
         raise ValueError("Không tìm thấy đoạn văn bản nào để xử lý. Kiểm tra định dạng file.")
 
     print(f"Đã chia thành {len(chunks)} đoạn văn bản.")
 
-    # Tạo embedding cho từng chunk
+    # Tạo embedding theo batch
     documents = []
     embeddings = []
     ids = []
     metadatas = []
 
     print("Đang tạo embeddings (có thể mất vài giây đến vài phút tùy kích thước)...")
-    for idx, chunk in enumerate(chunks):
+    for start in range(0, len(chunks), EMBEDDING_BATCH_SIZE):
+        batch = chunks[start:start + EMBEDDING_BATCH_SIZE]
         try:
-            embedding = get_embedding(chunk)
-            
+            batch_embeddings = get_embeddings(batch)
+        except Exception as exc:
+            print(f"   Failed Lỗi tại đoạn {start + 1}-{start + len(batch)}: {exc}")
+            continue
+
+        for offset, (chunk, embedding) in enumerate(zip(batch, batch_embeddings)):
+            idx = start + offset
             doc_id = f"policy_{idx:04d}"
             documents.append(chunk)
             embeddings.append(embedding)
@@ -119,14 +135,11 @@ def ingest_policy_documents(source_file: str = "data/policy.txt") -> None:
             metadatas.append({
                 "source": source_file,
                 "chunk_index": idx,
-                "char_length": len(chunk)
+                "char_length": len(chunk),
+                "token_count": count_tokens(chunk)
             })
 
-            print(f"   Processed [{idx + 1}/{len(chunks)}] Đoạn {idx + 1} → {len(chunk):,} ký tự")
-
-        except Exception as exc:
-            print(f"   Failed Lỗi tại đoạn {idx + 1}: {exc}")
-            continue
+            print(f"   Processed [{idx + 1}/{len(chunks)}] Đoạn {idx + 1} → {count_tokens(chunk):,} token")
 
     # Lưu vào ChromaDB (batch insert)
     if documents:
@@ -139,6 +152,11 @@ def ingest_policy_documents(source_file: str = "data/policy.txt") -> None:
         print(f"\nTHÀNH CÔNG! Đã nạp {len(documents)} đoạn chính sách vào ChromaDB.")
         print(f"   → Collection: {COLLECTION_NAME}")
         print(f"   → Tổng số vector: {collection.count()}")
+
+        # Xuất thêm index NumPy (mmap) cho POLICY_BACKEND=numpy
+        export_index(VECTOR_INDEX_PATH, ids, documents, embeddings, metadatas, dtype=VECTOR_INDEX_DTYPE,
+                     extra_meta={METADATA_KEY: embedding_provider.name})
+        print(f"   → NumPy index: {VECTOR_INDEX_PATH} ({VECTOR_INDEX_DTYPE})")
     else:
         print("\nKhông có dữ liệu nào được nạp. Vui lòng kiểm tra file nguồn và kết nối mạng.")
 
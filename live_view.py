@@ -0,0 +1,293 @@
+"""
+Cache lịch họp / thông báo theo user, cập nhật bằng sự kiện do backend đẩy sang (thay vì poll).
+
+Backend gửi sự kiện qua webhook POST /api/events hoặc ghi vào Redis stream EVENTS_STREAM:
+    {"type": "MEETING_UPSERTED",     "users": ["alice@cmc.com", ...], "meeting": {...}}
+    {"type": "MEETING_DELETED",      "users": [...], "meetingId": 12}
+    {"type": "NOTIFICATION_CREATED", "users": [...], "notification": {...}}
+    {"type": "NOTIFICATION_READ",    "users": [...], "notificationId": 34}
+"users" là giá trị field LIVE_VIEW_USER_FIELD (mặc định "email") trong GET /users/me của từng user liên quan.
+
+Định danh user của view do backend xác thực: token → GET /users/me (backend verify chữ ký), kết quả cache theo
+token đã băm, không quá thời điểm token hết hạn. Không bao giờ lấy định danh từ payload JWT chưa verify.
+Backend đẩy sự kiện qua webhook bắt buộc có EVENTS_WEBHOOK_SECRET (chưa cấu hình → webhook bị tắt).
+
+Materialized view trong Redis (mỗi user):
+- view:{user}:meetings       hash meetingId → meeting JSON
+- view:{user}:notifications  hash notificationId → notification JSON
+- view:{user}:warm:{kind}    cờ còn hiệu lực cho từng loại (TTL = VIEW_TTL)
+- view:{user}:version:{kind} tăng mỗi khi có sự kiện cho user (kể cả lúc view cold)
+Tool đọc view khi còn "warm"; view "cold" (chưa có / hết hạn) → gọi backend rồi nạp lại view.
+Việc nạp lại chỉ được ghi nếu không có sự kiện nào tới trong lúc gọi backend (so version, WATCH/MULTI),
+nếu không dữ liệu vừa lấy có thể đã cũ → giữ view cold, lần đọc sau gọi backend lại.
+
+Thử cục bộ: python live_view.py '{"type": "NOTIFICATION_CREATED", "users": ["alice"], "notification": {"id": 1}}'
+"""
+
+import os
+import sys
+import json
+import hmac
+import time
+import socket
+import threading
+import redis
+from dotenv import load_dotenv
+from redis_store import redis_client, hash_token, token_expiry
+
+load_dotenv()
+
+# Chỉ bật khi backend đã được cấu hình đẩy sự kiện, nếu không view sẽ cũ tới VIEW_TTL giây
+LIVE_VIEW_ENABLED = os.getenv("LIVE_VIEW_ENABLED", "false").lower() == "true"
+LIVE_VIEW_USER_FIELD = os.getenv("LIVE_VIEW_USER_FIELD", "email")
+VIEW_TTL = int(os.getenv("VIEW_TTL", 900))                      # Sau thời gian này view bị coi là cold → đồng bộ lại
+VIEW_IDENTITY_TTL = int(os.getenv("VIEW_IDENTITY_TTL", 600))    # Cache kết quả /users/me theo token
+VIEW_MAX_NOTIFICATIONS = int(os.getenv("VIEW_MAX_NOTIFICATIONS", 50))
+EVENTS_WEBHOOK_SECRET = os.getenv("EVENTS_WEBHOOK_SECRET", "")
+EVENTS_STREAM = os.getenv("EVENTS_STREAM", "meeting-events")
+EVENTS_STREAM_ENABLED = os.getenv("EVENTS_STREAM_ENABLED", "false").lower() == "true"
+EVENTS_CONSUMER_GROUP = os.getenv("EVENTS_CONSUMER_GROUP", "ai-service")
+
+MEETINGS = "meetings"
+NOTIFICATIONS = "notifications"
+
+# 1. KEY & USER
+
+def _fetch_identity(token: str):
+    """Hỏi backend token này là của ai (backend verify chữ ký). None nếu token không hợp lệ / lỗi."""
+    from tools import get_current_user    # Import lười: tools.py cũng import module này
+    user = get_current_user(token)
+    if not isinstance(user, dict) or user.get(LIVE_VIEW_USER_FIELD) is None:
+        return None
+    return str(user[LIVE_VIEW_USER_FIELD])
+
+def user_key(token: str):
+    """Định danh user đã được backend xác thực, cache theo token đã băm (chỉ cache kết quả hợp lệ)."""
+    cache_key = f"view_identity:{hash_token(token)}"
+    try:
+        cached = redis_client.get(cache_key)
+        if cached:
+            return cached
+    except Exception as e:
+        print(f"[WARN] Live view identity cache failed: {e}")
+        return None
+
+    user = _fetch_identity(token)
+    if user:
+        ttl = VIEW_IDENTITY_TTL
+        expires_at = token_expiry(token)
+        if expires_at:
+            ttl = min(ttl, int(expires_at - time.time()))
+        if ttl > 0:
+            try:
+                redis_client.set(cache_key, user, ex=ttl)
+            except Exception:
+                pass
+    return user
+
+def _key(user: str, kind: str) -> str:
+    return f"view:{user}:{kind}"
+
+def _is_warm(user: str, kind: str) -> bool:
+    return bool(redis_client.exists(_key(user, f"warm:{kind}")))
+
+def _view_user(token: str):
+    if not LIVE_VIEW_ENABLED or not redis_client:
+        return None
+    return user_key(token)
+
+# 2. ĐỌC / NẠP VIEW (dùng trong tools.py)
+
+def read_view(token: str, kind: str):
+    """Trả list từ view nếu warm, None nếu cold (caller tự gọi backend)."""
+    user = _view_user(token)
+    if not user:
+        return None
+    try:
+        if not _is_warm(user, kind):
+            return None
+        items = [json.loads(v) for v in redis_client.hvals(_key(user, kind))]
+        if kind == MEETINGS:
+            items.sort(key=lambda m: m.get("startTime") or "")
+        else:
+            items.sort(key=lambda n: n.get("createdAt") or n.get("id") or 0, reverse=True)
+        return items
+    except Exception as e:
+        print(f"[WARN] Live view read failed: {e}")
+        return None
+
+def _warm(user: str, kind: str, items: list, version) -> bool:
+    """Nạp lại view từ dữ liệu backend; bỏ qua nếu version đã đổi (có sự kiện tới trong lúc gọi backend)."""
+    version_key = _key(user, f"version:{kind}")
+    try:
+        with redis_client.pipeline() as pipe:
+            pipe.watch(version_key)
+            if pipe.get(version_key) != version:
+                return False
+            pipe.multi()
+            pipe.delete(_key(user, kind))
+            mapping = {str(i.get("id")): json.dumps(i, ensure_ascii=False, default=str) for i in items if isinstance(i, dict)}
+            if mapping:
+                pipe.hset(_key(user, kind), mapping=mapping)
+            pipe.expire(_key(user, kind), VIEW_TTL * 2)
+            pipe.set(_key(user, f"warm:{kind}"), 1, ex=VIEW_TTL)
+            pipe.execute()
+            return True
+    except redis.WatchError:
+        return False
+    except Exception as e:
+        print(f"[WARN] Live view warm-up failed: {e}")
+        return False
+
+def invalidate(token: str):
+    """Đánh dấu view của user là cold (vd: user vừa tạo/sửa/hủy lịch qua trợ lý)."""
+    user = _view_user(token)
+    if not user:
+        return
+    try:
+        redis_client.delete(_key(user, f"warm:{MEETINGS}"), _key(user, f"warm:{NOTIFICATIONS}"))
+    except Exception as e:
+        print(f"[WARN] Live view invalidation failed: {e}")
+
+def read_or_fetch(token: str, kind: str, fetch):
+    """Đọc view; nếu cold thì gọi `fetch()` (backend) và nạp lại view. Kết quả lỗi không được cache."""
+    cached = read_view(token, kind)
+    if cached is not None:
+        return cached
+    user = _view_user(token)
+    version = None
+    if user:
+        try:
+            version = redis_client.get(_key(user, f"version:{kind}"))
+        except Exception:
+            user = None
+    result = fetch()
+    if user and isinstance(result, list):
+        _warm(user, kind, result, version)
+    return result
+
+# 3. ÁP DỤNG SỰ KIỆN
+
+EVENT_KINDS = {
+    "MEETING_UPSERTED": MEETINGS, "MEETING_DELETED": MEETINGS,
+    "NOTIFICATION_CREATED": NOTIFICATIONS, "NOTIFICATION_READ": NOTIFICATIONS,
+}
+
+def apply_event(event: dict) -> int:
+    """Cập nhật view của các user liên quan. Trả về số user được cập nhật."""
+    if not redis_client:
+        return 0
+    event_type = event.get("type")
+    kind = EVENT_KINDS.get(event_type)
+    if not kind:
+        return 0
+    updated = 0
+    for user in event.get("users") or []:
+        user = str(user)
+        # Tăng version trước (kể cả khi view cold) → lần nạp view đang chạy dở sẽ bị hủy
+        version_key = _key(user, f"version:{kind}")
+        redis_client.incr(version_key)
+        redis_client.expire(version_key, VIEW_TTL * 2)
+        if not _is_warm(user, kind):
+            continue
+        if event_type == "MEETING_UPSERTED" and event.get("meeting"):
+            meeting = event["meeting"]
+            if meeting.get("status") == "CANCELLED":
+                redis_client.hdel(_key(user, MEETINGS), str(meeting.get("id")))
+            else:
+                redis_client.hset(_key(user, MEETINGS), str(meeting.get("id")), json.dumps(meeting, ensure_ascii=False, default=str))
+        elif event_type == "MEETING_DELETED":
+            redis_client.hdel(_key(user, MEETINGS), str(event.get("meetingId")))
+        elif event_type == "NOTIFICATION_CREATED" and event.get("notification"):
+            notification = event["notification"]
+            key = _key(user, NOTIFICATIONS)
+            redis_client.hset(key, str(notification.get("id")), json.dumps(notification, ensure_ascii=False, default=str))
+            _trim_notifications(key)
+        elif event_type == "NOTIFICATION_READ":
+            key = _key(user, NOTIFICATIONS)
+            raw = redis_client.hget(key, str(event.get("notificationId")))
+            if raw:
+                notification = json.loads(raw)
+                notification["isRead"] = True
+                redis_client.hset(key, str(event.get("notificationId")), json.dumps(notification, ensure_ascii=False, default=str))
+        else:
+            continue
+        updated += 1
+    return updated
+
+def apply_events(events: list) -> int:
+    """Áp dụng một lô sự kiện (blocking: nhiều lượt Redis mỗi user) — gọi qua asyncio.to_thread từ handler async."""
+    return sum(apply_event(e) for e in events if isinstance(e, dict))
+
+def _trim_notifications(key: str):
+    if redis_client.hlen(key) <= VIEW_MAX_NOTIFICATIONS:
+        return
+    items = sorted(
+        ((k, json.loads(v)) for k, v in redis_client.hgetall(key).items()),
+        key=lambda kv: kv[1].get("createdAt") or kv[1].get("id") or 0
+    )
+    redis_client.hdel(key, *[k for k, _ in items[:-VIEW_MAX_NOTIFICATIONS]])
+
+def verify_webhook_secret(secret: str) -> bool:
+    """Fail closed: chưa cấu hình EVENTS_WEBHOOK_SECRET thì không nhận sự kiện qua webhook."""
+    if not EVENTS_WEBHOOK_SECRET:
+        return False
+    return hmac.compare_digest(secret or "", EVENTS_WEBHOOK_SECRET)
+
+# 4. REDIS STREAM CONSUMER
+
+_stop_event = threading.Event()
+_consumer = None
+
+def _consume_loop():
+    consumer_name = f"{socket.gethostname()}-{os.getpid()}"
+    try:
+        redis_client.xgroup_create(EVENTS_STREAM, EVENTS_CONSUMER_GROUP, id="$", mkstream=True)
+    except Exception as e:
+        if "BUSYGROUP" not in str(e):
+            print(f"[ERROR] Cannot create consumer group: {e}")
+            return
+    print(f"[INFO] Consuming events from stream '{EVENTS_STREAM}' as {consumer_name}")
+    while not _stop_event.is_set():
+        try:
+            batches = redis_client.xreadgroup(EVENTS_CONSUMER_GROUP, consumer_name, {EVENTS_STREAM: ">"}, count=100, block=2000)
+            for _, messages in batches or []:
+                for message_id, fields in messages:
+                    try:
+                        apply_event(json.loads(fields.get("event", "{}")))
+                    except Exception as e:
+                        print(f"[WARN] Bad event {message_id}: {e}")
+                    redis_client.xack(EVENTS_STREAM, EVENTS_CONSUMER_GROUP, message_id)
+        except Exception as e:
+            print(f"[ERROR] Event consumer: {e}")
+            _stop_event.wait(2)
+
+def start_consumer():
+    """Gọi khi khởi động app (main.py), chỉ chạy khi EVENTS_STREAM_ENABLED=true và có Redis."""
+    global _consumer
+    if not EVENTS_STREAM_ENABLED or not redis_client or _consumer:
+        return
+    _stop_event.clear()
+    _consumer = threading.Thread(target=_consume_loop, name="event-consumer", daemon=True)
+    _consumer.start()
+
+def stop_consumer():
+    global _consumer
+    _stop_event.set()
+    if _consumer:
+        _consumer.join(timeout=5)
+        _consumer = None
+
+# 5. LOCAL EVENT PUBLISHER (dev/test)
+
+def publish_event(event: dict) -> str:
+    """Ghi sự kiện vào Redis stream như backend sẽ làm."""
+    if not redis_client:
+        raise RuntimeError("Redis is not available")
+    return redis_client.xadd(EVENTS_STREAM, {"event": json.dumps(event, ensure_ascii=False)})
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print(__doc__)
+        sys.exit(1)
+    print(publish_event(json.loads(sys.argv[1])))
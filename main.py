@@ -1,9 +1,16 @@
 import os
+import asyncio
 from dotenv import load_dotenv # Import thêm
-from fastapi import FastAPI, Header, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
+from typing import List, Optional
 from agent import simple_chat
+from admission import admit, AdmissionRejected
+from write_queue import start_workers, stop_workers, get_write_status, drain_write_outcomes
+from batch import run_batch, verify_batch_secret, BATCH_MAX_ITEMS, BATCH_CONCURRENCY
+import live_view
 import uvicorn
 
 # 1. Load biến môi trường
@@ -25,26 +32,101 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+def start_background_workers():
+    start_workers()
+    live_view.start_consumer()
+
+@app.on_event("shutdown")
+def stop_background_workers():
+    stop_workers()
+    live_view.stop_consumer()
+
+def _extract_token(authorization: str):
+    if not authorization:
+        raise HTTPException(status_code=401, detail="Token is missing")
+    # Lấy token (bỏ chữ Bearer nếu có)
+    return authorization.replace("Bearer ", "")
+
 class ChatPayload(BaseModel):
     message: str
 
+class BatchItem(BaseModel):
+    message: str
+    token: str
+    id: Optional[str] = None
+
+class BatchPayload(BaseModel):
+    items: List[BatchItem]
+    concurrency: int = BATCH_CONCURRENCY
+
 @app.get("/")
 def health_check():
     return {"status": "AI Service is running"}
 
 @app.post("/api/chat")
-async def chat(payload: ChatPayload, authorization: str = Header(None)):
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Token is missing")
-    
-    # Lấy token (bỏ chữ Bearer nếu có)
-    user_token = authorization.replace("Bearer ", "")
+async def chat(payload: ChatPayload, authorization: str = Header(None), idempotency_key: str = Header(None)):
+    user_token = _extract_token(authorization)
     
+    # Admission control: rate limit theo user + giới hạn đồng thời (429/503 kèm Retry-After)
+    try:
+        async with admit(user_token, payload.message):
+            try:
+                reply = await simple_chat(payload.message, user_token, idempotency_key)
+                return {"reply": reply}
+            except Exception as e:
+                return {"error": str(e)}
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail, headers={"Retry-After": str(e.retry_after)})
+
+@app.post("/api/chat/batch")
+async def chat_batch(payload: BatchPayload, x_batch_secret: str = Header(None)):
+    """
+    Chạy nhiều message (mỗi message một token) song song có giới hạn. Chỉ cho service nội bộ (X-Batch-Secret).
+    Trả về NDJSON: mỗi dòng {"index", "id", "reply"} hoặc {"index", "id", "error"} ngay khi item đó xong.
+    """
+    if not verify_batch_secret(x_batch_secret):
+        raise HTTPException(status_code=401, detail="Invalid batch secret")
+    if not payload.items:
+        raise HTTPException(status_code=400, detail="Batch is empty")
+    if len(payload.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {BATCH_MAX_ITEMS} items")
+
+    items = [
+        {"id": item.id, "message": item.message, "token": item.token.replace("Bearer ", "")}
+        for item in payload.items
+    ]
+    return StreamingResponse(run_batch(items, simple_chat, payload.concurrency), media_type="application/x-ndjson")
+
+@app.get("/api/chat/writes")
+def pending_write_outcomes(authorization: str = Header(None)):
+    """Kết quả các thao tác ghi (tạo/sửa/hủy lịch) đã hoàn tất, dành cho client poll/hiển thị thông báo."""
+    user_token = _extract_token(authorization)
+    return {"outcomes": drain_write_outcomes(user_token)}
+
+@app.get("/api/chat/writes/{idempotency_key}")
+def write_status(idempotency_key: str, authorization: str = Header(None)):
+    user_token = _extract_token(authorization)
+    status = get_write_status(user_token, idempotency_key)
+    if not status:
+        raise HTTPException(status_code=404, detail="Write job not found")
+    return status
+
+@app.post("/api/events")
+async def receive_events(request: Request, x_webhook_secret: str = Header(None)):
+    """Webhook để backend đẩy sự kiện thay đổi lịch họp / thông báo (một sự kiện hoặc danh sách)."""
+    if not live_view.EVENTS_WEBHOOK_SECRET:
+        raise HTTPException(status_code=503, detail="Events webhook is not configured")
+    if not live_view.verify_webhook_secret(x_webhook_secret):
+        raise HTTPException(status_code=401, detail="Invalid webhook secret")
     try:
-        reply = await simple_chat(payload.message, user_token)
-        return {"reply": reply}
-    except Exception as e:
-        return {"error": str(e)}
+        body = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON body")
+    events = body if isinstance(body, list) else [body]
+    # Nhiều lượt Redis cho mỗi sự kiện → chạy trong thread, không chặn event loop của các chat đang xử lý
+    updated = await asyncio.to_thread(live_view.apply_events, events)
+    return {"received": len(events), "updated_views": updated}
 
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
@@ -0,0 +1,160 @@
+"""
+Định tuyến model theo từng giai đoạn của vòng lặp tool.
+
+Không phải lượt nào cũng cần cùng một model:
+- planning / chọn tool     → MODEL_PLANNER (hoặc MODEL_PLANNER_COMPLEX nếu yêu cầu phức tạp)
+- diễn đạt kết quả tool    → MODEL_SUMMARIZER (model rẻ/nhanh, chỉ dùng cho yêu cầu đơn giản, không ghi)
+- nén lịch sử hội thoại    → MODEL_COMPACTION
+
+Tên model và ngưỡng lấy từ .env. Instance model (kèm tool schema đã build sẵn) được cache theo tên.
+Đặt MODEL_BACKEND=local để chạy với model giả lập cục bộ (không gọi Gemini) khi dev/test.
+"""
+
+import os
+import re
+import threading
+from types import SimpleNamespace
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# 1. CẤU HÌNH
+
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "gemini")   # gemini | local
+MODEL_PLANNER = os.getenv("MODEL_PLANNER", "models/gemini-2.5-flash")
+MODEL_PLANNER_COMPLEX = os.getenv("MODEL_PLANNER_COMPLEX", MODEL_PLANNER)
+MODEL_SUMMARIZER = os.getenv("MODEL_SUMMARIZER", "models/gemini-2.5-flash-lite")
+MODEL_COMPACTION = os.getenv("MODEL_COMPACTION", "models/gemini-2.5-flash-lite")
+
+ROUTING_LONG_MESSAGE_CHARS = int(os.getenv("ROUTING_LONG_MESSAGE_CHARS", 200))
+ROUTING_COMPLEX_THRESHOLD = int(os.getenv("ROUTING_COMPLEX_THRESHOLD", 2))
+
+STAGE_PLANNER = "planner"
+STAGE_PLANNER_COMPLEX = "planner_complex"   # Key trong stage_models: planner cho yêu cầu phức tạp
+STAGE_SUMMARIZER = "summarizer"
+STAGE_COMPACTION = "compaction"
+
+COMPLEXITY_SIMPLE = "simple"
+COMPLEXITY_COMPLEX = "complex"
+
+# Dấu hiệu yêu cầu cần nhiều bước / suy luận (lịch định kỳ, nhiều ý trong một câu, ...)
+_RECURRING_PATTERN = re.compile(r"định kỳ|hàng (ngày|tuần|tháng|năm)|mỗi (thứ|tuần|ngày|tháng)|chuỗi|series|lặp", re.IGNORECASE)
+_MULTI_STEP_PATTERN = re.compile(r"\bsau đó\b|\brồi\b|\bđồng thời\b|\bvà (tạo|hủy|huỷ|sửa|đặt|mời)\b", re.IGNORECASE)
+_WRITE_PATTERN = re.compile(r"đặt|tạo|hủy|huỷ|sửa|đổi|dời|mời", re.IGNORECASE)
+
+def classify_complexity(message: str) -> str:
+    """Chấm điểm thô độ phức tạp của yêu cầu để chọn model."""
+    text = message or ""
+    # Yêu cầu ghi (đặt/sửa/hủy lịch...): lượt sau tool thường phải điền tham số cho tool ghi
+    # → không giao cho summarizer dù câu ngắn
+    if _WRITE_PATTERN.search(text):
+        return COMPLEXITY_COMPLEX
+    score = 0
+    if len(text) > ROUTING_LONG_MESSAGE_CHARS:
+        score += 1
+    if _RECURRING_PATTERN.search(text):
+        score += 2
+    if _MULTI_STEP_PATTERN.search(text):
+        score += 1
+    return COMPLEXITY_COMPLEX if score >= ROUTING_COMPLEX_THRESHOLD else COMPLEXITY_SIMPLE
+
+# 2. MODEL FACTORIES
+
+def gemini_factory(model_name: str, tools: list):
+    import google.generativeai as genai
+    return genai.GenerativeModel(model_name=model_name, tools=tools)
+
+class LocalStandInModel:
+    """
+    Model giả lập: mặc định trả lời text cố định. Truyền `responder(message)` để kịch bản hóa khi test;
+    responder trả về str (câu trả lời text) hoặc {"function_call": {"name": ..., "args": {...}}}
+    để model "gọi tool" như Gemini (xem scripted_responder).
+    """
+    def __init__(self, model_name: str, tools: list = None, responder=None):
+        self.model_name = model_name
+        self.tools = tools
+        self.responder = responder or (lambda message: f"[{model_name}] OK")
+
+    def start_chat(self, history=None, **kwargs):
+        return _LocalChatSession(self, list(history or []))
+
+    def generate_content(self, contents, **kwargs):
+        return _local_response(self.responder(contents))
+
+class _LocalChatSession:
+    def __init__(self, model: LocalStandInModel, history: list):
+        self.model = model
+        self.history = history
+
+    def send_message(self, content, **kwargs):
+        self.history.append(content)
+        response = _local_response(self.model.responder(content))
+        self.history.append(response.text)
+        return response
+
+def _local_response(reply):
+    if isinstance(reply, dict) and reply.get("function_call"):
+        call = reply["function_call"]
+        function_call = SimpleNamespace(name=call["name"], args=dict(call.get("args") or {}))
+        part = SimpleNamespace(function_call=function_call, text="")
+        return SimpleNamespace(parts=[part], text="")
+    part = SimpleNamespace(function_call=None, text=reply)
+    return SimpleNamespace(parts=[part], text=reply)
+
+def scripted_responder(steps: list):
+    """Responder trả lần lượt từng bước trong `steps` (str hoặc function_call dict), hết kịch bản → "OK"."""
+    remaining = list(steps)
+    return lambda message: remaining.pop(0) if remaining else "OK"
+
+def local_factory(model_name: str, tools: list):
+    return LocalStandInModel(model_name, tools)
+
+# 3. ROUTER
+
+class ModelRouter:
+    def __init__(self, tools: list, factory=None, stage_models: dict = None):
+        self.tools = tools                                  # Tool schema build một lần, dùng chung
+        self.factory = factory or (local_factory if MODEL_BACKEND == "local" else gemini_factory)
+        self.stage_models = stage_models or {
+            STAGE_PLANNER: MODEL_PLANNER,
+            STAGE_PLANNER_COMPLEX: MODEL_PLANNER_COMPLEX,
+            STAGE_SUMMARIZER: MODEL_SUMMARIZER,
+            STAGE_COMPACTION: MODEL_COMPACTION,
+        }
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def get_model(self, model_name: str, with_tools: bool = True):
+        key = (model_name, with_tools)
+        model = self._cache.get(key)
+        if model is None:
+            with self._lock:
+                model = self._cache.get(key)
+                if model is None:
+                    model = self.factory(model_name, self.tools if with_tools else None)
+                    self._cache[key] = model
+        return model
+
+    def model_name_for(self, stage: str, complexity: str = COMPLEXITY_SIMPLE) -> str:
+        if stage == STAGE_PLANNER and complexity == COMPLEXITY_COMPLEX:
+            # Như MODEL_PLANNER_COMPLEX: không cấu hình riêng → dùng planner thường
+            return self.stage_models.get(STAGE_PLANNER_COMPLEX, self.stage_models[STAGE_PLANNER])
+        if stage == STAGE_SUMMARIZER and complexity == COMPLEXITY_COMPLEX:
+            # Yêu cầu phức tạp: giữ model planner cho cả lượt sau tool (có thể cần gọi tiếp tool khác)
+            return self.model_name_for(STAGE_PLANNER, complexity)
+        return self.stage_models[stage]
+
+    def model_for(self, stage: str, complexity: str = COMPLEXITY_SIMPLE):
+        # Compaction chỉ sinh text → không gắn tool
+        return self.get_model(self.model_name_for(stage, complexity), with_tools=stage != STAGE_COMPACTION)
+
+    def start_chat(self, stage: str, complexity: str, history: list):
+        return self.model_for(stage, complexity).start_chat(history=history, enable_automatic_function_calling=False)
+
+    def switch_chat(self, chat, stage: str, complexity: str):
+        """Chuyển phiên chat đang chạy sang model của stage khác, giữ nguyên lịch sử."""
+        target = self.model_name_for(stage, complexity)
+        current = getattr(getattr(chat, "model", None), "model_name", None)
+        if current == target:
+            return chat
+        return self.start_chat(stage, complexity, list(chat.history))
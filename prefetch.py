@@ -0,0 +1,206 @@
+"""
+Prefetch ngữ cảnh theo phiên chat.
+
+Gần như mọi cuộc hội thoại đều cần: lịch họp của user, thông báo, danh sách phòng.
+Ở tin nhắn đầu tiên của phiên, 3 dữ liệu này được tải song song ở background; các lần model
+gọi get_my_meetings / get_notifications / get_rooms sau đó được trả từ snapshot thay vì gọi backend.
+Tùy chọn: chèn bản tóm tắt (digest) của snapshot vào prompt để model khỏi phải gọi tool.
+
+Khi LIVE_VIEW_ENABLED, lịch họp và thông báo đã có view luôn được cập nhật theo sự kiện (live_view.py):
+snapshot không lưu 2 loại này (tránh trả dữ liệu cũ hơn view), prefetch chỉ gọi chúng để làm warm view,
+còn digest đọc thẳng từ view.
+"""
+
+import os
+import json
+import time
+import asyncio
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+import live_view
+from redis_store import redis_client, hash_token
+from tools import get_my_meetings, get_notifications, get_rooms, filter_meetings_by_date
+
+load_dotenv()
+
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "true").lower() == "true"
+PREFETCH_TTL = int(os.getenv("PREFETCH_TTL", 120))                        # Giây snapshot còn hiệu lực
+PREFETCH_DIGEST = os.getenv("PREFETCH_DIGEST", "false").lower() == "true"  # Chèn digest vào prompt
+PREFETCH_DIGEST_WAIT = float(os.getenv("PREFETCH_DIGEST_WAIT", 1.5))      # Chờ tối đa snapshot để dựng digest
+
+# Tool → hàm lấy dữ liệu thô (không lọc) cho snapshot
+PREFETCH_SOURCES = {
+    "get_my_meetings": get_my_meetings,
+    "get_notifications": get_notifications,
+    "get_rooms": get_rooms,
+}
+
+# Tool có live view tương ứng (không lưu vào snapshot khi LIVE_VIEW_ENABLED)
+LIVE_VIEW_SOURCES = {
+    "get_my_meetings": live_view.MEETINGS,
+    "get_notifications": live_view.NOTIFICATIONS,
+}
+
+# Các tool làm dữ liệu snapshot lỗi thời
+INVALIDATING_TOOLS = {
+    "create_meeting", "update_meeting", "cancel_meeting",
+    "update_meeting_series", "cancel_meeting_series",
+    "respond_invitation", "check_in_meeting", "check_in_by_qr",
+}
+
+_inflight = {}    # user_hash -> asyncio.Task (trong worker hiện tại)
+_local = {}       # user_hash -> snapshot (khi không có Redis)
+
+def _snapshot_key(user_hash: str):
+    return f"prefetch:{user_hash}"
+
+def _is_error(result) -> bool:
+    return isinstance(result, dict) and "error" in result
+
+def _served_by_view(fname: str) -> bool:
+    return live_view.LIVE_VIEW_ENABLED and fname in LIVE_VIEW_SOURCES
+
+# 1. LƯU / ĐỌC SNAPSHOT
+
+def _save(user_hash: str, snapshot: dict):
+    if redis_client:
+        try:
+            redis_client.set(_snapshot_key(user_hash), json.dumps(snapshot, ensure_ascii=False, default=str), ex=PREFETCH_TTL)
+            return
+        except Exception as e:
+            print(f"[WARN] Cannot save prefetch snapshot: {e}")
+    _local[user_hash] = snapshot
+
+def _load(user_hash: str):
+    if redis_client:
+        try:
+            data = redis_client.get(_snapshot_key(user_hash))
+            return json.loads(data) if data else None
+        except Exception:
+            pass
+    snapshot = _local.get(user_hash)
+    if snapshot and time.time() - snapshot.get("fetched_at", 0) < PREFETCH_TTL:
+        return snapshot
+    return None
+
+def invalidate(user_token: str, fname: str = None):
+    """Xóa snapshot khi user vừa thay đổi dữ liệu (tạo/sửa/hủy lịch, check-in...)."""
+    if fname and fname not in INVALIDATING_TOOLS:
+        return
+    user_hash = hash_token(user_token)
+    task = _inflight.pop(user_hash, None)
+    if task:
+        task.cancel()
+    _local.pop(user_hash, None)
+    if redis_client:
+        try:
+            redis_client.delete(_snapshot_key(user_hash))
+        except Exception:
+            pass
+
+# 2. PREFETCH
+
+async def _fetch_all(user_token: str, user_hash: str):
+    names = list(PREFETCH_SOURCES)
+    results = await asyncio.gather(
+        *(asyncio.to_thread(PREFETCH_SOURCES[n], user_token) for n in names),
+        return_exceptions=True
+    )
+    snapshot = {"fetched_at": time.time()}
+    for name, result in zip(names, results):
+        # Không cache lỗi → lần gọi tool sau sẽ gọi backend như bình thường
+        if _served_by_view(name):
+            continue    # Lần gọi ở trên đã nạp view; đọc lại từ view để thấy cả sự kiện tới sau
+        if not isinstance(result, Exception) and not _is_error(result):
+            snapshot[name] = result
+    _save(user_hash, snapshot)
+    return snapshot
+
+def start_prefetch(user_token: str):
+    """Khởi động prefetch ở background (không chờ). Gọi ở tin nhắn đầu tiên của phiên."""
+    if not PREFETCH_ENABLED:
+        return
+    user_hash = hash_token(user_token)
+    task = _inflight.get(user_hash)
+    if task and not task.done():
+        return
+    if _load(user_hash):
+        return
+    task = asyncio.create_task(_fetch_all(user_token, user_hash))
+    task.add_done_callback(lambda t: _inflight.pop(user_hash, None) if _inflight.get(user_hash) is t else None)
+    _inflight[user_hash] = task
+
+async def _load_or_wait(user_hash: str, wait: float = None):
+    task = _inflight.get(user_hash)
+    if task and not task.done():
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout=wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            return None
+        except Exception as e:
+            print(f"[WARN] Prefetch failed: {e}")
+            return None
+    return _load(user_hash)
+
+async def get_snapshot(user_token: str, wait: float = None):
+    """
+    Snapshot hiện có; nếu đang tải trong worker này thì chờ tối đa `wait` giây.
+    Lịch họp / thông báo lấy từ live view (nếu bật và đang warm) thay cho snapshot.
+    """
+    snapshot = await _load_or_wait(hash_token(user_token), wait)
+    if not live_view.LIVE_VIEW_ENABLED:
+        return snapshot
+    snapshot = dict(snapshot or {})
+    for name, kind in LIVE_VIEW_SOURCES.items():
+        view = await asyncio.to_thread(live_view.read_view, user_token, kind)
+        if view is not None:
+            snapshot[name] = view
+    return snapshot or None
+
+# 3. PHỤC VỤ TOOL CALL TỪ SNAPSHOT
+
+async def serve(user_token: str, fname: str, call_args: dict):
+    """Trả (True, result) nếu tool call được phục vụ từ snapshot, ngược lại (False, None)."""
+    # Tool có live view tự đọc view (luôn mới hơn snapshot) → không phục vụ từ đây
+    if not PREFETCH_ENABLED or fname not in PREFETCH_SOURCES or _served_by_view(fname):
+        return False, None
+    snapshot = await get_snapshot(user_token)
+    if not snapshot or fname not in snapshot:
+        return False, None
+
+    data = snapshot[fname]
+    if fname == "get_my_meetings" and call_args.get("date_filter"):
+        return True, filter_meetings_by_date(data, call_args["date_filter"])
+    return True, data
+
+# 4. DIGEST CHO PROMPT
+
+def build_digest(snapshot: dict, now: datetime = None) -> str:
+    """Tóm tắt ngắn gọn snapshot: lịch hôm nay / tuần này, thông báo chưa đọc, danh sách phòng."""
+    if not snapshot:
+        return ""
+    now = now or datetime.now()
+    today = now.strftime("%Y-%m-%d")
+    week_end = (now + timedelta(days=7)).strftime("%Y-%m-%d")
+    lines = []
+
+    meetings = snapshot.get("get_my_meetings")
+    if isinstance(meetings, list):
+        upcoming = [m for m in meetings if today <= (m.get("startTime") or "")[:10] <= week_end]
+        upcoming.sort(key=lambda m: m.get("startTime") or "")
+        lines.append(f"- Lịch họp 7 ngày tới ({len(upcoming)}):")
+        for m in upcoming[:10]:
+            series = f", seriesId={m['seriesId']}" if m.get("seriesId") else ""
+            lines.append(f"  • id={m.get('id')} | {m.get('startTime')} → {m.get('endTime')} | {m.get('title')}{series}")
+
+    notifications = snapshot.get("get_notifications")
+    if isinstance(notifications, list):
+        unread = [n for n in notifications if not (n.get("isRead") or n.get("read"))]
+        lines.append(f"- Thông báo chưa đọc: {len(unread)}")
+
+    rooms = snapshot.get("get_rooms")
+    if isinstance(rooms, list):
+        room_list = ", ".join(f"{r.get('id')}:{r.get('name')}" for r in rooms if isinstance(r, dict))
+        lines.append(f"- Phòng họp (id:tên): {room_list}")
+
+    return "\n".join(lines)
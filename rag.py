@@ -0,0 +1,194 @@
+"""
+Tiện ích RAG cho tra cứu chính sách: đếm token, chia chunk, chọn lọc và ghép context trong giới hạn token.
+
+ingest.py chia tài liệu bằng chunk_text (giới hạn theo token, có overlap giữa các chunk liền kề).
+search_policy lấy nhiều ứng viên hơn số cần dùng (RAG_CANDIDATES), sau đó:
+1. Bỏ ứng viên kém liên quan: cosine < RAG_MIN_SIMILARITY hoặc thấp hơn ứng viên tốt nhất quá RAG_MAX_SIMILARITY_GAP
+2. Loại các chunk gần như trùng nhau (Jaccard trên token, do chunk có phần overlap)
+3. Rerank rẻ: độ tương đồng vector + độ trùng từ với câu hỏi, chọn đa dạng bằng MMR
+4. Ghép tối đa RAG_MAX_CHUNKS chunk, không vượt quá RAG_TOKEN_BUDGET, kèm trích dẫn nguồn + chunk_index
+"""
+
+import os
+import re
+from typing import List
+from dotenv import load_dotenv
+
+load_dotenv()
+
+RAG_CANDIDATES = int(os.getenv("RAG_CANDIDATES", 8))
+RAG_TOKEN_BUDGET = int(os.getenv("RAG_TOKEN_BUDGET", 400))
+RAG_MAX_CHUNKS = int(os.getenv("RAG_MAX_CHUNKS", 3))
+RAG_MIN_SIMILARITY = float(os.getenv("RAG_MIN_SIMILARITY", 0.3))       # Cosine tối thiểu (tùy embedding provider)
+RAG_MAX_SIMILARITY_GAP = float(os.getenv("RAG_MAX_SIMILARITY_GAP", 0.1))  # Kém ứng viên tốt nhất quá mức này → bỏ
+RAG_DEDUP_THRESHOLD = float(os.getenv("RAG_DEDUP_THRESHOLD", 0.85))   # Jaccard >= ngưỡng → coi là trùng
+RAG_MMR_LAMBDA = float(os.getenv("RAG_MMR_LAMBDA", 0.7))              # 1.0 = chỉ độ liên quan, 0 = chỉ đa dạng
+RAG_LEXICAL_WEIGHT = float(os.getenv("RAG_LEXICAL_WEIGHT", 0.3))      # Trọng số độ trùng từ khi rerank
+
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", 180))         # Kích thước tối đa một chunk
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", 30))  # Phần lặp lại giữa 2 chunk liền kề khi cắt giữa đoạn
+CHUNK_MIN_TOKENS = int(os.getenv("CHUNK_MIN_TOKENS", 40))          # Đoạn ngắn hơn → gộp với đoạn kế tiếp
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+_WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+# 1. TOKEN
+
+def tokenize(text: str) -> list:
+    """Tách token xấp xỉ: mỗi âm tiết / từ / dấu câu là một token (đủ sát với tokenizer của LLM cho tiếng Việt)."""
+    return _TOKEN_PATTERN.findall(text)
+
+def count_tokens(text: str) -> int:
+    return len(tokenize(text))
+
+def _word_set(text: str) -> set:
+    return {w.lower() for w in _WORD_PATTERN.findall(text) if len(w) > 1}
+
+def _jaccard(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+# 2. CHUNKING (dùng trong ingest.py)
+
+def _is_heading(line: str) -> bool:
+    """Tiêu đề phần: dòng ngắn, toàn chữ HOA (vd: "PHẦN 2: QUY ĐỊNH VỀ THAY ĐỔI VÀ HỦY BỎ")."""
+    return len(line) < 120 and line.isupper()
+
+def _split_long_line(line: str, max_tokens: int, overlap_tokens: int = 0) -> List[str]:
+    """
+    Cắt một dòng quá dài thành nhiều phần theo từ; mỗi phần sau mở đầu bằng các từ cuối
+    (tối đa overlap_tokens token) của phần trước.
+    """
+    # Token không vượt qua khoảng trắng → số token của cả dòng = tổng số token từng từ
+    words = [(w, count_tokens(w)) for w in line.split()]
+    pieces, current, used, carried = [], [], 0, 0
+    for word, tokens in words:
+        if len(current) > carried and used + tokens > max_tokens:
+            pieces.append(" ".join(w for w, _ in current))
+            tail, tail_tokens = [], 0
+            for w, t in reversed(current):
+                if tail_tokens + t > overlap_tokens or len(tail) + 1 >= len(current):
+                    break
+                tail.insert(0, (w, t))
+                tail_tokens += t
+            current, used, carried = tail, tail_tokens, len(tail)
+        current.append((word, tokens))
+        used += tokens
+    if len(current) > carried or not pieces:
+        pieces.append(" ".join(w for w, _ in current))
+    return pieces
+
+def chunk_text(raw_text: str, max_tokens: int = CHUNK_MAX_TOKENS,
+               overlap_tokens: int = CHUNK_OVERLAP_TOKENS, min_tokens: int = CHUNK_MIN_TOKENS) -> List[str]:
+    """
+    Chia văn bản thành các chunk có kích thước ổn định theo token:
+    - Không vượt quá max_tokens; đoạn quá dài bị cắt theo dòng (hoặc theo từ) với phần overlap
+    - Đoạn quá ngắn (< min_tokens) được gộp với đoạn kế tiếp trong cùng một phần
+    - Không gộp qua ranh giới tiêu đề phần; mỗi chunk được gắn tiêu đề phần của nó để giữ ngữ cảnh
+    """
+    chunks = []
+    heading = ""
+    lines, tokens = [], 0
+
+    def flush():
+        nonlocal lines, tokens
+        if lines:
+            body = "\n".join(lines)
+            chunks.append(f"{heading}\n{body}" if heading and not body.startswith(heading) else body)
+        lines, tokens = [], 0
+
+    def overlap_tail():
+        # Lấy các dòng cuối của chunk trước (trong giới hạn overlap_tokens) làm phần mở đầu chunk mới
+        tail, used = [], 0
+        for line in reversed(lines):
+            t = count_tokens(line)
+            if used + t > overlap_tokens:
+                break
+            tail.insert(0, line)
+            used += t
+        return tail, used
+
+    budget = max_tokens - (count_tokens(heading) if heading else 0)
+    for raw_line in raw_text.splitlines():
+        line = raw_line.strip()
+        if not line:
+            # Hết đoạn: chỉ tách chunk nếu chunk hiện tại đã đủ lớn
+            if tokens >= min_tokens:
+                flush()
+            continue
+        if _is_heading(line):
+            flush()
+            heading = line
+            budget = max_tokens - count_tokens(heading)
+            continue
+
+        pieces = _split_long_line(line, budget, overlap_tokens) if count_tokens(line) > budget else [line]
+        for i, piece in enumerate(pieces):
+            piece_tokens = count_tokens(piece)
+            if lines and tokens + piece_tokens > budget:
+                # Phần cắt từ cùng một dòng đã tự mang overlap ở đầu → không lặp thêm dòng cũ
+                tail, tail_tokens = overlap_tail() if i == 0 else ([], 0)
+                flush()
+                if tail_tokens + piece_tokens <= budget:
+                    lines, tokens = tail, tail_tokens
+            lines.append(piece)
+            tokens += piece_tokens
+    flush()
+    return chunks
+
+# 3. CHỌN LỌC ỨNG VIÊN
+
+def select_context(query: str, documents: list, metadatas: list, distances: list = None,
+                   token_budget: int = RAG_TOKEN_BUDGET, max_chunks: int = RAG_MAX_CHUNKS,
+                   min_similarity: float = RAG_MIN_SIMILARITY, max_gap: float = RAG_MAX_SIMILARITY_GAP) -> list:
+    """
+    documents / metadatas theo thứ tự vector search (gần nhất trước).
+    distances: khoảng cách cosine (1 - cosine) của từng ứng viên; không có → chỉ dùng thứ hạng, không lọc ngưỡng.
+    Trả về danh sách (document, metadata) đã lọc, dedup, rerank, tối đa max_chunks và vừa token_budget.
+    """
+    query_words = _word_set(query)
+    n = len(documents)
+    if distances is not None:
+        similarities = [1.0 - float(d) for d in distances]
+        best = max(similarities, default=0.0)
+        floor = max(min_similarity, best - max_gap)
+    else:
+        similarities = [1.0 - rank / max(n, 1) for rank in range(n)]
+        floor = float("-inf")
+
+    candidates = []
+    for doc, meta, similarity in zip(documents, metadatas, similarities):
+        if similarity < floor:
+            continue
+        words = _word_set(doc)
+        # Bỏ chunk gần như trùng với chunk xếp hạng cao hơn
+        if any(_jaccard(words, c["words"]) >= RAG_DEDUP_THRESHOLD for c in candidates):
+            continue
+        lexical_score = len(query_words & words) / len(query_words) if query_words else 0.0
+        candidates.append({
+            "doc": doc, "meta": meta or {}, "words": words,
+            "relevance": (1 - RAG_LEXICAL_WEIGHT) * similarity + RAG_LEXICAL_WEIGHT * lexical_score,
+            "tokens": count_tokens(doc),
+        })
+
+    # MMR: cân bằng giữa độ liên quan và việc không lặp lại nội dung đã chọn
+    selected, used = [], 0
+    while candidates and len(selected) < max_chunks:
+        best_candidate = max(candidates, key=lambda c: RAG_MMR_LAMBDA * c["relevance"] - (1 - RAG_MMR_LAMBDA) * max(
+            (_jaccard(c["words"], s["words"]) for s in selected), default=0.0))
+        candidates.remove(best_candidate)
+        if used + best_candidate["tokens"] > token_budget:
+            continue    # Không vừa → thử chunk khác ngắn hơn
+        selected.append(best_candidate)
+        used += best_candidate["tokens"]
+    return [(c["doc"], c["meta"]) for c in selected]
+
+def format_context(selected: list) -> str:
+    """Ghép context kèm trích dẫn: [1] (nguồn: data/policy.txt, chunk_index 3)."""
+    blocks = []
+    for i, (doc, meta) in enumerate(selected, 1):
+        source = meta.get("source", "unknown")
+        chunk_index = meta.get("chunk_index", "?")
+        blocks.append(f"[{i}] (nguồn: {source}, chunk_index {chunk_index})\n{doc}")
+    return "\n---\n".join(blocks)
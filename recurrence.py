@@ -0,0 +1,312 @@
+"""
+Recurrence engine cục bộ: kiểm tra rule lặp lại, khai triển thành các buổi họp cụ thể và
+phát hiện trùng lịch trước khi gửi create_meeting / update_meeting_series xuống backend.
+
+- Khai triển bằng NumPy datetime64 (chuỗi hằng ngày cả năm vẫn chỉ là vài phép toán mảng)
+- Interval index: booking sắp theo giờ bắt đầu + prefix-max giờ kết thúc → kiểm tra tất cả
+  các buổi trong một lượt searchsorted (vectorized)
+- Trả về danh sách ngày bị trùng cho model thay vì để backend từ chối rồi model phải thử lại
+
+Mức độ trùng:
+- Phòng đã được đặt / thành viên được mời đang bận → chặn, không gửi xuống backend
+- Chỉ trùng với lịch của chính user (vd: cuộc họp user được mời) → cảnh báo, vẫn ghi
+"""
+
+import os
+import calendar
+import numpy as np
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+load_dotenv()
+
+RECURRENCE_MAX_MONTHS = int(os.getenv("RECURRENCE_MAX_MONTHS", 6))  # Quy định: chuỗi định kỳ tối đa 6 tháng
+MAX_REPORTED_CONFLICTS = int(os.getenv("MAX_REPORTED_CONFLICTS", 10))
+RECURRENCE_ROOM_CHECKS = int(os.getenv("RECURRENCE_ROOM_CHECKS", 0))     # Số buổi tối đa hỏi backend phòng trống (0 = tắt)
+RECURRENCE_ROOM_CHECK_THREADS = int(os.getenv("RECURRENCE_ROOM_CHECK_THREADS", 4))
+
+FREQUENCIES = {"DAILY", "WEEKLY", "MONTHLY", "YEARLY"}
+WEEKDAYS = ["MONDAY", "TUESDAY", "WEDNESDAY", "THURSDAY", "FRIDAY", "SATURDAY", "SUNDAY"]
+
+# 1970-01-01 là thứ Năm → offset để quy datetime64[D] về thứ Hai đầu tuần
+_EPOCH_WEEKDAY = 3
+
+# 1. VALIDATE
+
+def _parse_datetime(value: str, field: str, errors: list):
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        errors.append(f"{field} không đúng định dạng ISO 8601 (YYYY-MM-DDTHH:mm:ss): {value}")
+        return None
+    # Backend và lịch đã cache dùng giờ địa phương không kèm múi giờ → không so sánh được với "Z" / "+07:00"
+    if parsed.tzinfo is not None:
+        errors.append(f"{field} phải là giờ địa phương không kèm múi giờ (YYYY-MM-DDTHH:mm:ss), "
+                      f"không dùng 'Z' hoặc '+07:00': {value}")
+        return None
+    return parsed
+
+def _add_months(day, months: int):
+    """Cộng tháng theo lịch; ngày không tồn tại ở tháng đích → ngày cuối tháng (31/08 + 6 tháng = 28/02)."""
+    month_index = day.month - 1 + months
+    year, month = day.year + month_index // 12, month_index % 12 + 1
+    return day.replace(year=year, month=month, day=min(day.day, calendar.monthrange(year, month)[1]))
+
+def validate_rule(recurrence: dict, start_time: str, end_time: str) -> list:
+    """Trả về danh sách lỗi (rỗng nếu rule hợp lệ)."""
+    errors = []
+    start = _parse_datetime(start_time, "start_time", errors)
+    end = _parse_datetime(end_time, "end_time", errors)
+    if start and end and end <= start:
+        errors.append("end_time phải sau start_time.")
+
+    frequency = recurrence.get("frequency")
+    if frequency not in FREQUENCIES:
+        errors.append(f"frequency không hợp lệ: {frequency}. Chỉ chấp nhận {sorted(FREQUENCIES)}.")
+
+    try:
+        interval = int(recurrence.get("interval", 1))
+        if interval < 1:
+            errors.append("interval phải >= 1.")
+    except (TypeError, ValueError):
+        errors.append(f"interval không hợp lệ: {recurrence.get('interval')}")
+
+    until = None
+    try:
+        until = datetime.strptime(str(recurrence.get("repeatUntil")), "%Y-%m-%d").date()
+    except ValueError:
+        errors.append(f"repeatUntil không đúng định dạng YYYY-MM-DD: {recurrence.get('repeatUntil')}")
+    if until and start:
+        if until < start.date():
+            errors.append("repeatUntil phải sau ngày bắt đầu.")
+        elif until > _add_months(start.date(), RECURRENCE_MAX_MONTHS):
+            errors.append(f"Chuỗi định kỳ chỉ được kéo dài tối đa {RECURRENCE_MAX_MONTHS} tháng "
+                          f"(repeatUntil muộn nhất: {_add_months(start.date(), RECURRENCE_MAX_MONTHS)}).")
+
+    days = recurrence.get("daysOfWeek") or []
+    invalid_days = [d for d in days if d not in WEEKDAYS]
+    if invalid_days:
+        errors.append(f"daysOfWeek không hợp lệ: {invalid_days}. Chỉ chấp nhận {WEEKDAYS}.")
+    return errors
+
+def is_expandable(recurrence: dict) -> bool:
+    """
+    daysOfWeek với MONTHLY / YEARLY được gửi nguyên cho backend nhưng không khai triển cục bộ được
+    chắc chắn (ngữ nghĩa tùy backend) → bỏ qua kiểm tra trùng cho các rule này.
+    """
+    return not recurrence.get("daysOfWeek") or recurrence.get("frequency") in ("DAILY", "WEEKLY")
+
+# 2. EXPAND
+
+def expand_days(recurrence: dict, start_date) -> np.ndarray:
+    """Khai triển rule thành mảng datetime64[D] các ngày họp (đã giả định rule hợp lệ)."""
+    frequency = recurrence["frequency"]
+    interval = int(recurrence.get("interval", 1))
+    first = np.datetime64(start_date, "D")
+    last = np.datetime64(recurrence["repeatUntil"], "D")
+
+    if frequency == "DAILY":
+        result = np.arange(first, last + 1, np.timedelta64(interval, "D"))
+        if recurrence.get("daysOfWeek"):
+            # Như BYDAY của RRULE: DAILY + daysOfWeek → chỉ giữ các thứ được chọn
+            weekdays = (result.astype(np.int64) + _EPOCH_WEEKDAY) % 7
+            result = result[np.isin(weekdays, [WEEKDAYS.index(d) for d in recurrence["daysOfWeek"]])]
+        return result
+
+    if frequency == "WEEKLY":
+        days = recurrence.get("daysOfWeek") or [WEEKDAYS[start_date.weekday()]]
+        offsets = np.array(sorted({WEEKDAYS.index(d) for d in days}), dtype="timedelta64[D]")
+        # Thứ Hai của tuần bắt đầu
+        week_start = first - ((first.astype(np.int64) + _EPOCH_WEEKDAY) % 7).astype("timedelta64[D]")
+        weeks = np.arange(week_start, last + 1, np.timedelta64(7 * interval, "D"))
+        result = (weeks[:, None] + offsets[None, :]).ravel()
+        return result[(result >= first) & (result <= last)]
+
+    if frequency == "MONTHLY":
+        months = np.arange(first.astype("datetime64[M]"), last.astype("datetime64[M]") + 1, interval)
+        result = months.astype("datetime64[D]") + np.timedelta64(start_date.day - 1, "D")
+        # Bỏ các tháng không có ngày đó (vd: 31/02)
+        result = result[result.astype("datetime64[M]") == months]
+        return result[(result >= first) & (result <= last)]
+
+    # YEARLY
+    years = np.arange(first.astype("datetime64[Y]"), last.astype("datetime64[Y]") + 1, interval)
+    result = (years.astype("datetime64[M]") + np.timedelta64(start_date.month - 1, "M")).astype("datetime64[D]") \
+        + np.timedelta64(start_date.day - 1, "D")
+    # Bỏ các năm không có ngày đó (vd: 29/02) — ngày bị tràn sang tháng sau
+    result = result[result.astype("datetime64[M]").astype(np.int64) % 12 == start_date.month - 1]
+    return result[(result >= first) & (result <= last)]
+
+def expand(recurrence: dict, start_time: str, end_time: str):
+    """Trả về (starts, ends) dạng datetime64[m] cho từng buổi họp trong chuỗi."""
+    start = datetime.fromisoformat(start_time)
+    end = datetime.fromisoformat(end_time)
+    days = expand_days(recurrence, start.date())
+    time_of_day = np.timedelta64(start.hour * 60 + start.minute, "m")
+    duration = np.timedelta64(int((end - start).total_seconds() // 60), "m")
+    starts = days.astype("datetime64[m]") + time_of_day
+    return starts, starts + duration
+
+# 3. INTERVAL INDEX
+
+class IntervalIndex:
+    """Index các khoảng thời gian đã đặt: sort theo start + prefix-max của end."""
+    def __init__(self, starts: np.ndarray, ends: np.ndarray, payload: list):
+        order = np.argsort(starts, kind="stable")
+        self.starts = starts[order]
+        self.ends = ends[order]
+        self.payload = [payload[i] for i in order]
+        self.max_end = np.maximum.accumulate(self.ends) if len(self.ends) else self.ends
+
+    def overlaps(self, q_starts: np.ndarray, q_ends: np.ndarray) -> np.ndarray:
+        """Mask bool: buổi thứ i có trùng với ít nhất 1 booking hay không (một lượt vectorized)."""
+        if not len(self.starts):
+            return np.zeros(len(q_starts), dtype=bool)
+        # Các booking có start < q_end là prefix [0, idx)
+        idx = np.searchsorted(self.starts, q_ends, side="left")
+        has_candidates = idx > 0
+        prefix_max = self.max_end[np.maximum(idx - 1, 0)]
+        return has_candidates & (prefix_max > q_starts)
+
+    def conflicts_with(self, q_start, q_end) -> list:
+        """Danh sách booking trùng với một buổi cụ thể (chỉ gọi cho các buổi đã biết là trùng)."""
+        idx = int(np.searchsorted(self.starts, q_end, side="left"))
+        return [self.payload[i] for i in range(idx) if self.ends[i] > q_start]
+
+# 4. CONFLICT PRE-CHECK
+
+def _meeting_room_id(m: dict):
+    room = m.get("room")
+    if isinstance(room, dict):
+        return room.get("id")
+    return m.get("roomId")
+
+def _meeting_participant_ids(m: dict) -> set:
+    ids = set(m.get("participantIds") or [])
+    for p in m.get("participants") or []:
+        if isinstance(p, dict) and p.get("status") != "DECLINED":
+            ids.add(p.get("id") or p.get("userId"))
+    return ids
+
+def _naive_minutes(value: str):
+    parsed = datetime.fromisoformat(value)
+    return None if parsed.tzinfo is not None else np.datetime64(parsed, "m")
+
+def build_booking_index(meetings: list, room_id: int = None, participant_ids=None, exclude_series_id: str = None,
+                        blocking_only: bool = False):
+    """
+    Dựng interval index từ lịch họp đã cache của user. Payload ghi rõ lý do trùng; "blocking" = True khi
+    cuộc họp đó dùng cùng phòng hoặc có thành viên được mời (trùng chắc chắn, backend sẽ từ chối).
+    blocking_only=True → chỉ index các cuộc họp blocking.
+    """
+    participant_ids = set(participant_ids or [])
+    starts, ends, payload = [], [], []
+    for m in meetings or []:
+        if not isinstance(m, dict) or m.get("status") in ("CANCELLED", "REJECTED"):
+            continue
+        if exclude_series_id and str(m.get("seriesId")) == str(exclude_series_id):
+            continue
+        try:
+            s, e = _naive_minutes(m["startTime"]), _naive_minutes(m["endTime"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        if s is None or e is None:
+            continue
+        reasons = []
+        if room_id is not None and _meeting_room_id(m) == room_id:
+            reasons.append("phòng đã được đặt")
+        shared = participant_ids & _meeting_participant_ids(m)
+        if shared:
+            reasons.append(f"thành viên {sorted(shared)} bận")
+        if blocking_only and not reasons:
+            continue
+        starts.append(s)
+        ends.append(e)
+        payload.append({
+            "meeting_id": m.get("id"), "title": m.get("title"),
+            "reasons": reasons or ["bạn đã có lịch"], "blocking": bool(reasons),
+        })
+    return IntervalIndex(np.array(starts, dtype="datetime64[m]"), np.array(ends, dtype="datetime64[m]"), payload)
+
+def _iso(value: np.datetime64) -> str:
+    return value.astype(datetime).isoformat(timespec="seconds")
+
+def _room_conflicts(starts: np.ndarray, ends: np.ndarray, candidates: np.ndarray, room_available) -> dict:
+    """
+    Hỏi backend phòng còn trống cho các buổi chưa biết là trùng. Chuỗi dài → lấy mẫu đều
+    RECURRENCE_ROOM_CHECKS buổi. Trả {index buổi: True nếu phòng đã bị đặt}; lỗi / không rõ → bỏ qua.
+    """
+    if len(candidates) > RECURRENCE_ROOM_CHECKS:
+        candidates = candidates[np.unique(np.linspace(0, len(candidates) - 1, RECURRENCE_ROOM_CHECKS).astype(int))]
+    with ThreadPoolExecutor(max_workers=RECURRENCE_ROOM_CHECK_THREADS) as pool:
+        answers = pool.map(lambda i: room_available(_iso(starts[i]), _iso(ends[i])), candidates)
+        return {int(i): answer is False for i, answer in zip(candidates, answers)}
+
+def _describe(starts, ends, i, conflicting) -> dict:
+    return {
+        "date": str(starts[i].astype("datetime64[D]")),
+        "start": str(starts[i]), "end": str(ends[i]),
+        "conflicting": conflicting,
+    }
+
+def precheck_series(recurrence: dict, start_time: str, end_time: str, meetings: list,
+                    room_id: int = None, participant_ids=None, exclude_series_id: str = None,
+                    room_available=None):
+    """
+    Kiểm tra rule + trùng lịch cho toàn bộ chuỗi.
+    room_available(start_iso, end_iso) -> True / False / None (không rõ): hỏi backend phòng còn trống không
+    (chỉ dùng khi RECURRENCE_ROOM_CHECKS > 0; mặc định chỉ kiểm tra trên lịch đã cache, backend kiểm tra khi ghi).
+
+    Trả về:
+    - None nếu không phát hiện gì
+    - {"error": ...} nếu rule sai hoặc trùng phòng / thành viên → trả thẳng cho model, không ghi
+    - {"warning": ...} nếu chỉ trùng với lịch của chính user → vẫn ghi, kèm cảnh báo cho model
+    """
+    errors = validate_rule(recurrence, start_time, end_time)
+    if errors:
+        return {"error": "Recurrence rule không hợp lệ.", "details": errors}
+    if not is_expandable(recurrence):
+        return {"warning": "Không kiểm tra trước được trùng lịch cho rule này (daysOfWeek với "
+                           f"{recurrence.get('frequency')}); backend sẽ kiểm tra khi ghi."}
+
+    starts, ends = expand(recurrence, start_time, end_time)
+    if not len(starts):
+        return {"error": "Rule lặp lại không sinh ra buổi họp nào. Kiểm tra lại daysOfWeek / repeatUntil."}
+
+    blocking_index = build_booking_index(meetings, room_id, participant_ids, exclude_series_id, blocking_only=True)
+    blocking = blocking_index.overlaps(starts, ends)
+    room_checked = 0
+    if room_available and room_id is not None and RECURRENCE_ROOM_CHECKS > 0:
+        checked = _room_conflicts(starts, ends, np.flatnonzero(~blocking), room_available)
+        room_checked = len(checked)
+        room_busy = [i for i, busy in checked.items() if busy]
+        blocking[room_busy] = True
+
+    if blocking.any():
+        conflicts = []
+        for i in np.flatnonzero(blocking)[:MAX_REPORTED_CONFLICTS]:
+            conflicting = blocking_index.conflicts_with(starts[i], ends[i]) or [{"reasons": ["phòng đã được đặt"], "blocking": True}]
+            conflicts.append(_describe(starts, ends, i, conflicting))
+        return {
+            "error": "Chuỗi lịch bị trùng phòng hoặc thành viên đã bận. Chưa tạo/sửa gì trên hệ thống.",
+            "total_occurrences": int(len(starts)),
+            "conflict_count": int(blocking.sum()),
+            "conflicts": conflicts,
+            "hint": "Hãy báo user các ngày bị trùng và hỏi có muốn đổi giờ/phòng hoặc điều chỉnh rule không.",
+        }
+
+    calendar_index = build_booking_index(meetings, exclude_series_id=exclude_series_id)
+    overlaps = calendar_index.overlaps(starts, ends)
+    if not overlaps.any():
+        return None
+    return {
+        "warning": "Một số buổi trùng giờ với lịch hiện có của user (phòng và thành viên không bị trùng).",
+        "total_occurrences": int(len(starts)),
+        "overlap_count": int(overlaps.sum()),
+        "room_checked_occurrences": room_checked,
+        "overlaps": [
+            _describe(starts, ends, i, calendar_index.conflicts_with(starts[i], ends[i]))
+            for i in np.flatnonzero(overlaps)[:MAX_REPORTED_CONFLICTS]
+        ],
+    }
@@ -0,0 +1,48 @@
+import os
+import json
+import base64
+import hashlib
+import redis
+from dotenv import load_dotenv
+
+# Kết nối Redis dùng chung cho agent (chat history), admission control, ...
+# Tách riêng khỏi agent.py để các module khác dùng được mà không import cả Gemini.
+load_dotenv()
+
+redis_host = os.getenv("REDIS_HOST", "localhost")
+redis_port = int(os.getenv("REDIS_PORT", 6379))
+redis_password = os.getenv("REDIS_PASSWORD")
+redis_db = int(os.getenv("REDIS_DB", 0))
+if redis_password == "": redis_password = None
+
+try:
+    redis_client = redis.Redis(
+        host=redis_host, port=redis_port, password=redis_password, db=redis_db,
+        decode_responses=True, socket_connect_timeout=5
+    )
+    redis_client.ping()
+    print(f"[INFO] Redis connected: {redis_host}:{redis_port}")
+except Exception as e:
+    print(f"[ERROR] Redis connection failed: {e}")
+    redis_client = None
+
+def hash_token(user_token: str) -> str:
+    """Băm token để làm key Redis (không lưu JWT thô làm key)."""
+    if user_token.startswith("Bearer "):
+        user_token = user_token[len("Bearer "):]
+    return hashlib.sha256(user_token.encode("utf-8")).hexdigest()[:32]
+
+def token_expiry(user_token: str):
+    """
+    Thời điểm hết hạn (claim exp, epoch giây) của JWT, None nếu không đọc được.
+    Không verify chữ ký: chỉ dùng để rút ngắn thời gian lưu dữ liệu gắn với token, không dùng để xác thực.
+    """
+    try:
+        if user_token.startswith("Bearer "):
+            user_token = user_token[len("Bearer "):]
+        payload = user_token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        exp = json.loads(base64.urlsafe_b64decode(payload)).get("exp")
+        return float(exp) if exp is not None else None
+    except Exception:
+        return None
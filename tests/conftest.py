@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Test chạy từ thư mục gốc của repo: các module nằm phẳng ở đó (agent.py, tools.py, ...)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,123 @@
+import asyncio
+import pytest
+import fakeredis
+
+from admission import (
+    TokenBucketLimiter, PriorityGate, AdmissionRejected,
+    classify_priority, PRIORITY_ACTION, PRIORITY_BROWSE, PRIORITY_BATCH,
+)
+
+# 1. TOKEN BUCKET
+
+@pytest.fixture(params=["redis", "local"])
+def limiter(request):
+    if request.param == "redis":
+        pytest.importorskip("lupa")    # fakeredis cần lupa để chạy script Lua
+        return TokenBucketLimiter(burst=3, per_minute=6, client=fakeredis.FakeRedis(decode_responses=True))
+    return TokenBucketLimiter(burst=3, per_minute=6)
+
+def test_token_bucket_allows_burst_then_rejects(limiter):
+    results = [limiter.take("token-a") for _ in range(4)]
+    assert [allowed for allowed, _ in results] == [True, True, True, False]
+    # 6 token / phút → 10 giây cho token tiếp theo
+    assert 0 < results[-1][1] <= 10
+
+def test_token_bucket_is_per_user(limiter):
+    for _ in range(3):
+        limiter.take("token-a")
+    assert limiter.take("token-a")[0] is False
+    assert limiter.take("token-b")[0] is True
+
+def test_token_bucket_same_user_with_or_without_bearer(limiter):
+    for _ in range(3):
+        limiter.take("Bearer token-a")
+    assert limiter.take("token-a")[0] is False
+
+# 2. PRIORITY GATE
+
+def run(coro):
+    return asyncio.run(coro)
+
+def test_gate_admits_up_to_limit_without_waiting():
+    async def scenario():
+        gate = PriorityGate(max_concurrent=2, max_queue=4, timeout=1)
+        await gate.acquire(PRIORITY_BROWSE)
+        await gate.acquire(PRIORITY_BROWSE)
+        assert gate.active == 2
+        gate.release()
+        gate.release()
+        assert gate.active == 0
+    run(scenario())
+
+def test_gate_hands_slot_to_highest_priority_waiter():
+    async def scenario():
+        gate = PriorityGate(max_concurrent=1, max_queue=4, timeout=1)
+        await gate.acquire(PRIORITY_BROWSE)
+        order = []
+
+        async def waiter(name, priority):
+            await gate.acquire(priority)
+            order.append(name)
+            gate.release()
+
+        tasks = [
+            asyncio.create_task(waiter("batch", PRIORITY_BATCH)),
+            asyncio.create_task(waiter("browse", PRIORITY_BROWSE)),
+            asyncio.create_task(waiter("action", PRIORITY_ACTION)),
+        ]
+        await asyncio.sleep(0)
+        gate.release()
+        await asyncio.gather(*tasks)
+        assert order == ["action", "browse", "batch"]
+        assert gate.active == 0
+    run(scenario())
+
+def test_gate_full_queue_evicts_lower_priority():
+    async def scenario():
+        gate = PriorityGate(max_concurrent=1, max_queue=1, timeout=1)
+        await gate.acquire(PRIORITY_BROWSE)
+        low = asyncio.create_task(gate.acquire(PRIORITY_BATCH))
+        await asyncio.sleep(0)
+        high = asyncio.create_task(gate.acquire(PRIORITY_ACTION))
+        await asyncio.sleep(0)
+
+        with pytest.raises(AdmissionRejected) as exc:
+            await low
+        assert exc.value.status_code == 503
+
+        gate.release()
+        await high
+        gate.release()
+        assert gate.active == 0
+    run(scenario())
+
+def test_gate_full_queue_rejects_same_priority():
+    async def scenario():
+        gate = PriorityGate(max_concurrent=1, max_queue=1, timeout=1)
+        await gate.acquire(PRIORITY_BROWSE)
+        queued = asyncio.create_task(gate.acquire(PRIORITY_BROWSE))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected):
+            await gate.acquire(PRIORITY_BROWSE)
+        gate.release()
+        await queued
+        gate.release()
+    run(scenario())
+
+def test_gate_timeout_rejects_with_retry_after():
+    async def scenario():
+        gate = PriorityGate(max_concurrent=1, max_queue=2, timeout=5)
+        await gate.acquire(PRIORITY_BROWSE)
+        with pytest.raises(AdmissionRejected) as exc:
+            await gate.acquire(PRIORITY_BROWSE, timeout=0.05)
+        assert exc.value.status_code == 503
+        assert exc.value.retry_after >= 1
+        # Waiter hết giờ không được nhận slot khi release
+        gate.release()
+        assert gate.active == 0
+    run(scenario())
+
+def test_classify_priority():
+    assert classify_priority("Check-in phòng 3 giúp tôi") == PRIORITY_ACTION
+    assert classify_priority("Hủy cuộc họp chiều nay") == PRIORITY_ACTION
+    assert classify_priority("Lịch họp hôm nay của tôi?") == PRIORITY_BROWSE
@@ -0,0 +1,77 @@
+import asyncio
+import importlib
+
+import pytest
+
+pytest.importorskip("google.generativeai")
+
+import live_view
+import prefetch
+
+RULE = {"frequency": "WEEKLY", "interval": 1, "repeatUntil": "2030-01-31", "daysOfWeek": ["MONDAY"]}
+CALL_ARGS = {"title": "Weekly", "start_time": "2030-01-07T09:00:00", "end_time": "2030-01-07T10:00:00",
+             "room_id": 1, "recurrence": RULE}
+BOOKED = [{"id": 9, "title": "Busy", "startTime": "2030-01-14T09:00:00", "endTime": "2030-01-14T10:00:00",
+           "room": {"id": 1}, "participants": []}]
+
+@pytest.fixture
+def agent(monkeypatch):
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")    # agent.py cần key khi MODEL_BACKEND=gemini (không gọi API)
+    module = importlib.import_module("agent")
+    fetched = []
+    monkeypatch.setattr(module, "fetch_all_my_meetings", lambda token: fetched.append(token) or BOOKED)
+    monkeypatch.setattr(live_view, "read_view", lambda token, kind: None)
+    monkeypatch.setattr(prefetch, "PREFETCH_ENABLED", True)
+    monkeypatch.setattr(prefetch, "get_snapshot", _snapshot(None))
+    module.fetched = fetched
+    return module
+
+def _snapshot(value):
+    async def get_snapshot(user_token, wait=None):
+        return value
+    return get_snapshot
+
+def precheck(agent):
+    return asyncio.run(agent.precheck_recurring_write("alice-token", "create_meeting", dict(CALL_ARGS)))
+
+def test_precheck_uses_live_view(agent, monkeypatch):
+    monkeypatch.setattr(live_view, "read_view", lambda token, kind: BOOKED)
+    assert precheck(agent)["conflict_count"] == 1
+    assert agent.fetched == []
+
+def test_precheck_uses_prefetch_snapshot(agent, monkeypatch):
+    monkeypatch.setattr(prefetch, "get_snapshot", _snapshot({"get_my_meetings": BOOKED}))
+    assert precheck(agent)["conflict_count"] == 1
+    assert agent.fetched == []
+
+def test_precheck_fetches_all_pages_when_caches_are_cold(agent):
+    assert precheck(agent)["conflict_count"] == 1
+    assert agent.fetched == ["alice-token"]
+
+def test_non_recurring_write_is_not_prechecked(agent):
+    args = {k: v for k, v in CALL_ARGS.items() if k != "recurrence"}
+    assert asyncio.run(agent.precheck_recurring_write("alice-token", "create_meeting", args)) is None
+    assert agent.fetched == []
+
+def test_batch_item_leaves_interactive_chat_state_alone(agent, monkeypatch):
+    import batch
+    from model_router import ModelRouter, LocalStandInModel, STAGE_PLANNER, STAGE_SUMMARIZER, STAGE_COMPACTION
+
+    touched = []
+    monkeypatch.setattr(agent, "get_chat_history", lambda token: touched.append("history") or [])
+    monkeypatch.setattr(agent, "drain_write_outcomes", lambda token: touched.append("outcomes") or [])
+    monkeypatch.setattr(agent, "save_chat_turn", lambda *args: touched.append("save"))
+    monkeypatch.setattr(prefetch, "PREFETCH_ENABLED", False)
+    monkeypatch.setattr(agent, "router", ModelRouter(
+        tools=[], factory=lambda name, tools: LocalStandInModel(name, tools, lambda message: "Xong."),
+        stage_models={STAGE_PLANNER: "m", STAGE_SUMMARIZER: "m", STAGE_COMPACTION: "m"}))
+
+    async def in_batch():
+        batch.current_batch.set(batch.BatchSharedData())
+        return await agent.simple_chat("Lịch họp hôm nay?", "alice-token")
+
+    assert asyncio.run(in_batch()) == "Xong."
+    assert touched == []
+
+    assert asyncio.run(agent.simple_chat("Lịch họp hôm nay?", "alice-token")) == "Xong."
+    assert touched == ["history", "outcomes", "save"]
@@ -0,0 +1,80 @@
+import json
+import asyncio
+import threading
+
+import admission
+import batch
+from admission import TokenBucketLimiter
+from batch import BatchSharedData, run_batch, serve_shared, verify_batch_secret
+
+def collect(items, chat_fn, concurrency=4):
+    async def scenario():
+        return [json.loads(line) async for line in run_batch(items, chat_fn, concurrency)]
+    return sorted(asyncio.run(scenario()), key=lambda r: r["index"])
+
+def test_items_are_charged_to_their_users_bucket(monkeypatch):
+    monkeypatch.setattr(admission, "rate_limiter", TokenBucketLimiter(burst=2, per_minute=1))
+    monkeypatch.setattr(admission, "BATCH_QUEUE_TIMEOUT", 5)    # Nạp lại mất 60s > thời gian được chờ → 429
+
+    async def chat_fn(message, token):
+        return f"{token}:{message}"
+
+    items = [{"id": str(i), "message": f"m{i}", "token": "alice"} for i in range(3)]
+    items.append({"id": "b", "message": "m", "token": "bob"})
+    results = collect(items, chat_fn)
+
+    assert [r.get("reply") for r in results] == ["alice:m0", "alice:m1", None, "bob:m"]
+    assert results[2]["status_code"] == 429
+    assert results[2]["retry_after"] >= 1
+
+def test_items_wait_for_refill_within_budget(monkeypatch):
+    # 1 token, nạp lại 10 token/giây → item sau chờ ~0.1s thay vì bị 429
+    monkeypatch.setattr(admission, "rate_limiter", TokenBucketLimiter(burst=1, per_minute=600))
+
+    async def chat_fn(message, token):
+        return message
+
+    results = collect([{"message": f"m{i}", "token": "alice"} for i in range(4)], chat_fn)
+    assert [r.get("reply") for r in results] == ["m0", "m1", "m2", "m3"]
+
+def test_failed_item_does_not_stop_others(monkeypatch):
+    monkeypatch.setattr(admission, "rate_limiter", TokenBucketLimiter(burst=10, per_minute=60))
+
+    async def chat_fn(message, token):
+        if message == "boom":
+            raise RuntimeError("backend down")
+        return "ok"
+
+    results = collect([{"message": "boom", "token": "a"}, {"message": "hi", "token": "b"}], chat_fn)
+    assert results[0]["error"] == "backend down"
+    assert results[1]["reply"] == "ok"
+
+def test_shared_reference_data_loaded_once_per_batch(monkeypatch):
+    calls = []
+
+    def fake_get_rooms(token):
+        calls.append(token)
+        return [{"id": 1, "name": "Sao Hỏa"}]
+
+    monkeypatch.setitem(batch.SHARED_SOURCES, "get_rooms", fake_get_rooms)
+    shared = BatchSharedData()
+    threads = [threading.Thread(target=shared.get, args=("get_rooms", f"t{i}")) for i in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
+
+    async def outside_batch():
+        return await serve_shared("get_rooms", {"token": "t"})
+    assert asyncio.run(outside_batch()) == (False, None)
+
+def test_batch_secret_fails_closed(monkeypatch):
+    monkeypatch.setattr(batch, "BATCH_API_SECRET", "")
+    assert verify_batch_secret("anything") is False
+    assert verify_batch_secret(None) is False
+
+    monkeypatch.setattr(batch, "BATCH_API_SECRET", "s3cret")
+    assert verify_batch_secret("s3cret") is True
+    assert verify_batch_secret("wrong") is False
+    assert verify_batch_secret(None) is False
@@ -0,0 +1,71 @@
+import importlib
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")    # fastapi.testclient cần httpx
+pytest.importorskip("google.generativeai")
+from fastapi.testclient import TestClient
+
+import admission
+import prefetch
+import write_queue
+from admission import TokenBucketLimiter
+from model_router import ModelRouter, LocalStandInModel, STAGE_PLANNER, STAGE_SUMMARIZER, STAGE_COMPACTION
+from write_queue import LocalWriteStore, process_job
+
+MEETING_CALL = {"function_call": {"name": "create_meeting", "args": {
+    "title": "Sprint review", "start_time": "2030-01-07T09:00:00", "end_time": "2030-01-07T10:00:00", "room_id": 3,
+}}}
+
+@pytest.fixture
+def api(monkeypatch):
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")    # agent.py cần key khi MODEL_BACKEND=gemini (không gọi API)
+    agent = importlib.import_module("agent")
+    main = importlib.import_module("main")
+
+    # Model giả lập: tin nhắn của user → gọi create_meeting; kết quả tool → trả lời text
+    def responder(message):
+        return MEETING_CALL if isinstance(message, str) else "Đã gửi yêu cầu tạo lịch."
+
+    router = ModelRouter(tools=[], factory=lambda name, tools: LocalStandInModel(name, tools, responder),
+                         stage_models={STAGE_PLANNER: "planner", STAGE_SUMMARIZER: "planner", STAGE_COMPACTION: "planner"})
+    monkeypatch.setattr(agent, "router", router)
+    monkeypatch.setattr(agent, "redis_client", None)
+    monkeypatch.setattr(prefetch, "PREFETCH_ENABLED", False)
+    monkeypatch.setattr(admission, "rate_limiter", TokenBucketLimiter(burst=10, per_minute=60))
+    monkeypatch.setattr(write_queue, "store", LocalWriteStore())
+    monkeypatch.setattr(write_queue, "WRITE_SYNC_WAIT", 0)
+
+    calls = []
+    monkeypatch.setitem(write_queue.available_tools, "create_meeting",
+                        lambda token, idempotency_key=None, **kwargs: calls.append(idempotency_key) or {"id": len(calls)})
+    return TestClient(main.app), calls
+
+def post_chat(client, headers):
+    response = client.post("/api/chat", json={"message": "Đặt phòng 3 lúc 9h"},
+                           headers={"Authorization": "Bearer alice-token", **headers})
+    assert response.status_code == 200
+    return response.json()
+
+def run_pending():
+    while True:
+        key = write_queue.store.pop(timeout=0.01)
+        if not key:
+            return
+        process_job(key)
+
+def test_client_retry_with_same_idempotency_key_writes_once(api):
+    client, calls = api
+    post_chat(client, {"Idempotency-Key": "req-1"})
+    post_chat(client, {"Idempotency-Key": "req-1"})    # Client gửi lại sau khi timeout
+    run_pending()
+    assert len(calls) == 1
+
+def test_new_requests_without_key_are_separate_writes(api):
+    client, calls = api
+    post_chat(client, {"Idempotency-Key": "req-1"})
+    post_chat(client, {"Idempotency-Key": "req-2"})
+    post_chat(client, {})
+    run_pending()
+    assert len(calls) == 3
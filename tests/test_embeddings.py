@@ -0,0 +1,51 @@
+import os
+import subprocess
+import sys
+import numpy as np
+import pytest
+
+from embeddings import HashingEmbeddingProvider, create_provider
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def cosine(a, b):
+    return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
+
+def test_hashing_vectors_are_normalized_with_configured_dim():
+    provider = HashingEmbeddingProvider(dim=64)
+    vectors = provider.embed_documents(["Hủy lịch họp trước 30 phút", "Check-in bằng mã QR"])
+    assert provider.name == "hashing:64"
+    assert [len(v) for v in vectors] == [64, 64]
+    assert all(np.linalg.norm(v) == pytest.approx(1.0) for v in vectors)
+
+def test_hashing_query_matches_document_embedding():
+    provider = HashingEmbeddingProvider(dim=64)
+    text = "Thời gian tối đa cho một cuộc họp là 4 tiếng"
+    assert provider.embed_query(text) == provider.embed_documents([text])[0]
+
+def test_hashing_is_deterministic_across_processes():
+    # md5 thay vì hash(): không phụ thuộc PYTHONHASHSEED của từng process
+    code = "from embeddings import HashingEmbeddingProvider; print(HashingEmbeddingProvider(dim=32).embed_query('phòng họp VIP'))"
+    outputs = {
+        subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                       env={**os.environ, "PYTHONHASHSEED": seed}, cwd=REPO_ROOT).stdout.strip().splitlines()[-1]
+        for seed in ("1", "2")
+    }
+    assert len(outputs) == 1
+
+def test_hashing_related_text_scores_higher():
+    provider = HashingEmbeddingProvider()
+    query = provider.embed_query("hủy lịch họp")
+    related, unrelated = provider.embed_documents([
+        "Người tổ chức phải hủy lịch họp trước ít nhất 30 phút.",
+        "Check-in bằng mã QR khi đến phòng.",
+    ])
+    assert cosine(query, related) > cosine(query, unrelated)
+
+def test_empty_text_gives_zero_vector():
+    assert not any(HashingEmbeddingProvider(dim=8).embed_query(""))
+
+def test_create_provider():
+    assert isinstance(create_provider("hashing"), HashingEmbeddingProvider)
+    with pytest.raises(ValueError):
+        create_provider("word2vec")
@@ -0,0 +1,148 @@
+import json
+import importlib
+
+import fakeredis
+import pytest
+
+import live_view
+
+USERS = {"alice-token": "alice@example.com", "bob-token": "bob@example.com"}
+
+@pytest.fixture
+def client(monkeypatch):
+    client = fakeredis.FakeRedis(decode_responses=True)
+    lookups = []
+
+    def fetch_identity(token):
+        lookups.append(token)
+        return USERS.get(token)
+
+    monkeypatch.setattr(live_view, "redis_client", client)
+    monkeypatch.setattr(live_view, "LIVE_VIEW_ENABLED", True)
+    monkeypatch.setattr(live_view, "_fetch_identity", fetch_identity)
+    client.lookups = lookups
+    return client
+
+def warm_meetings(token, meetings):
+    return live_view.read_or_fetch(token, live_view.MEETINGS, lambda: meetings)
+
+def test_unknown_token_gets_no_view(client):
+    warm_meetings("alice-token", [{"id": 1, "startTime": "2025-01-01T09:00"}])
+
+    # Token giả mạo (backend không nhận) không đọc được view của ai, luôn gọi backend
+    assert live_view.read_view("forged-token", live_view.MEETINGS) is None
+    assert live_view.read_or_fetch("forged-token", live_view.MEETINGS, lambda: []) == []
+    assert len(client.keys("view_identity:*")) == 1    # Chỉ cache định danh backend đã xác nhận
+
+def test_identity_is_cached_per_token(client):
+    warm_meetings("alice-token", [])
+    live_view.read_view("alice-token", live_view.MEETINGS)
+    live_view.read_view("alice-token", live_view.NOTIFICATIONS)
+    assert client.lookups == ["alice-token"]
+
+def test_read_or_fetch_warms_and_serves_view(client):
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return [{"id": 2, "startTime": "2025-01-02T09:00"}, {"id": 1, "startTime": "2025-01-01T09:00"}]
+
+    live_view.read_or_fetch("alice-token", live_view.MEETINGS, fetch)
+    result = live_view.read_or_fetch("alice-token", live_view.MEETINGS, fetch)
+    assert [m["id"] for m in result] == [1, 2]
+    assert len(calls) == 1
+
+def test_fetch_errors_are_not_cached(client):
+    assert warm_meetings("alice-token", {"error": "down"}) == {"error": "down"}
+    assert live_view.read_view("alice-token", live_view.MEETINGS) is None
+
+def test_meeting_events_update_warm_view(client):
+    warm_meetings("alice-token", [{"id": 1, "title": "Old", "startTime": "2025-01-01T09:00"}])
+    users = [USERS["alice-token"]]
+
+    assert live_view.apply_event({"type": "MEETING_UPSERTED", "users": users,
+                                  "meeting": {"id": 1, "title": "New", "startTime": "2025-01-01T09:00"}}) == 1
+    live_view.apply_event({"type": "MEETING_UPSERTED", "users": users,
+                           "meeting": {"id": 2, "title": "Added", "startTime": "2025-01-02T09:00"}})
+    assert [m["title"] for m in live_view.read_view("alice-token", live_view.MEETINGS)] == ["New", "Added"]
+
+    live_view.apply_event({"type": "MEETING_UPSERTED", "users": users, "meeting": {"id": 1, "status": "CANCELLED"}})
+    live_view.apply_event({"type": "MEETING_DELETED", "users": users, "meetingId": 2})
+    assert live_view.read_view("alice-token", live_view.MEETINGS) == []
+
+def test_notification_events_and_trim(client, monkeypatch):
+    monkeypatch.setattr(live_view, "VIEW_MAX_NOTIFICATIONS", 2)
+    live_view.read_or_fetch("alice-token", live_view.NOTIFICATIONS,
+                            lambda: [{"id": 1, "createdAt": "2025-01-01", "isRead": False}])
+    users = [USERS["alice-token"]]
+
+    live_view.apply_event({"type": "NOTIFICATION_READ", "users": users, "notificationId": 1})
+    for i in (2, 3):
+        live_view.apply_event({"type": "NOTIFICATION_CREATED", "users": users,
+                               "notification": {"id": i, "createdAt": f"2025-01-0{i}", "isRead": False}})
+
+    view = live_view.read_view("alice-token", live_view.NOTIFICATIONS)
+    assert [n["id"] for n in view] == [3, 2]
+    assert live_view.apply_event({"type": "NOTIFICATION_READ", "users": users, "notificationId": 1}) == 1
+    assert json.loads(client.hget("view:alice@example.com:notifications", "2"))["isRead"] is False
+
+def test_events_for_cold_views_are_skipped(client):
+    assert live_view.apply_event({"type": "MEETING_UPSERTED", "users": [USERS["bob-token"]],
+                                  "meeting": {"id": 1}}) == 0
+    assert not client.exists("view:bob@example.com:meetings")
+    assert live_view.apply_event({"type": "UNKNOWN", "users": [USERS["bob-token"]]}) == 0
+
+def test_event_during_fetch_prevents_warm_up(client):
+    def fetch():
+        # Sự kiện tới trong lúc đang gọi backend: dữ liệu vừa lấy có thể đã cũ
+        live_view.apply_event({"type": "MEETING_UPSERTED", "users": [USERS["alice-token"]],
+                               "meeting": {"id": 2, "startTime": "2025-01-02T09:00"}})
+        return [{"id": 1, "startTime": "2025-01-01T09:00"}]
+
+    assert [m["id"] for m in live_view.read_or_fetch("alice-token", live_view.MEETINGS, fetch)] == [1]
+    assert live_view.read_view("alice-token", live_view.MEETINGS) is None
+
+    result = warm_meetings("alice-token", [{"id": 1, "startTime": "2025-01-01T09:00"},
+                                           {"id": 2, "startTime": "2025-01-02T09:00"}])
+    assert live_view.read_view("alice-token", live_view.MEETINGS) == result
+
+def test_invalidate_makes_view_cold(client):
+    warm_meetings("alice-token", [])
+    live_view.invalidate("alice-token")
+    assert live_view.read_view("alice-token", live_view.MEETINGS) is None
+
+def test_disabled_view_always_fetches(client, monkeypatch):
+    monkeypatch.setattr(live_view, "LIVE_VIEW_ENABLED", False)
+    warm_meetings("alice-token", [{"id": 1}])
+    assert live_view.read_view("alice-token", live_view.MEETINGS) is None
+    assert client.lookups == []
+
+def test_webhook_secret_fails_closed(monkeypatch):
+    monkeypatch.setattr(live_view, "EVENTS_WEBHOOK_SECRET", "")
+    assert not live_view.verify_webhook_secret("")
+    assert not live_view.verify_webhook_secret(None)
+
+    monkeypatch.setattr(live_view, "EVENTS_WEBHOOK_SECRET", "s3cret")
+    assert live_view.verify_webhook_secret("s3cret")
+    assert not live_view.verify_webhook_secret("wrong")
+    assert not live_view.verify_webhook_secret(None)
+
+def test_events_webhook(client, monkeypatch):
+    pytest.importorskip("fastapi")
+    pytest.importorskip("google.generativeai")
+    from fastapi.testclient import TestClient
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")    # agent.py cần key khi MODEL_BACKEND=gemini (không gọi API)
+    api = TestClient(importlib.import_module("main").app)
+    event = {"type": "MEETING_DELETED", "users": [USERS["alice-token"]], "meetingId": 1}
+
+    monkeypatch.setattr(live_view, "EVENTS_WEBHOOK_SECRET", "")
+    assert api.post("/api/events", json=event).status_code == 503
+
+    monkeypatch.setattr(live_view, "EVENTS_WEBHOOK_SECRET", "s3cret")
+    assert api.post("/api/events", json=event, headers={"X-Webhook-Secret": "wrong"}).status_code == 401
+    assert api.post("/api/events", content=b"{not json", headers={"X-Webhook-Secret": "s3cret"}).status_code == 400
+
+    warm_meetings("alice-token", [{"id": 1, "startTime": "2025-01-01T09:00"}])
+    response = api.post("/api/events", json=[event, "junk"], headers={"X-Webhook-Secret": "s3cret"})
+    assert response.json() == {"received": 2, "updated_views": 1}
+    assert live_view.read_view("alice-token", live_view.MEETINGS) == []
@@ -0,0 +1,67 @@
+from model_router import (
+    ModelRouter, LocalStandInModel, classify_complexity, scripted_responder,
+    STAGE_PLANNER, STAGE_PLANNER_COMPLEX, STAGE_SUMMARIZER, STAGE_COMPACTION, COMPLEXITY_SIMPLE, COMPLEXITY_COMPLEX,
+)
+
+STAGE_MODELS = {STAGE_PLANNER: "planner", STAGE_PLANNER_COMPLEX: "planner-complex",
+                STAGE_SUMMARIZER: "summarizer", STAGE_COMPACTION: "compaction"}
+
+def make_router(responders=None):
+    created = []
+
+    def factory(model_name, tools):
+        created.append((model_name, tools))
+        return LocalStandInModel(model_name, tools, responder=(responders or {}).get(model_name))
+
+    return ModelRouter(tools=["schema"], factory=factory, stage_models=STAGE_MODELS), created
+
+def test_classify_complexity():
+    assert classify_complexity("Lịch họp hôm nay của tôi?") == COMPLEXITY_SIMPLE
+    assert classify_complexity("Đặt phòng họp hàng tuần vào thứ 2") == COMPLEXITY_COMPLEX
+
+def test_write_requests_never_go_to_summarizer():
+    # Câu ngắn nhưng có ý định ghi → lượt sau get_rooms sẽ điền tham số create_meeting
+    assert classify_complexity("Đặt phòng Sao Hỏa lúc 3h chiều mai") == COMPLEXITY_COMPLEX
+    assert classify_complexity("Hủy cuộc họp 12") == COMPLEXITY_COMPLEX
+    router, _ = make_router()
+    assert router.model_name_for(STAGE_SUMMARIZER, classify_complexity("Đặt phòng Sao Hỏa lúc 3h chiều mai")) == "planner-complex"
+
+def test_models_are_cached_and_compaction_has_no_tools():
+    router, created = make_router()
+    assert router.model_for(STAGE_PLANNER) is router.model_for(STAGE_PLANNER)
+    router.model_for(STAGE_COMPACTION)
+    assert created == [("planner", ["schema"]), ("compaction", None)]
+
+def test_complex_requests_keep_planner_after_tool_call():
+    router, _ = make_router()
+    assert router.model_name_for(STAGE_SUMMARIZER, COMPLEXITY_SIMPLE) == "summarizer"
+    assert router.model_name_for(STAGE_PLANNER, COMPLEXITY_COMPLEX) == "planner-complex"
+    assert router.model_name_for(STAGE_SUMMARIZER, COMPLEXITY_COMPLEX) == "planner-complex"
+
+def test_complex_planner_defaults_to_injected_planner():
+    stage_models = {k: v for k, v in STAGE_MODELS.items() if k != STAGE_PLANNER_COMPLEX}
+    router = ModelRouter(tools=[], factory=lambda name, tools: LocalStandInModel(name, tools), stage_models=stage_models)
+    assert router.model_name_for(STAGE_PLANNER, COMPLEXITY_COMPLEX) == "planner"
+
+def test_scripted_function_call_then_summarizer_reply():
+    router, _ = make_router({
+        "planner": scripted_responder([{"function_call": {"name": "get_rooms", "args": {}}}]),
+        "summarizer": scripted_responder(["Có 3 phòng trống."]),
+    })
+    chat = router.start_chat(STAGE_PLANNER, COMPLEXITY_SIMPLE, history=["earlier turn"])
+    response = chat.send_message("Phòng nào còn trống?")
+    call = response.parts[0].function_call
+    assert call.name == "get_rooms" and call.args == {}
+
+    chat = router.switch_chat(chat, STAGE_SUMMARIZER, COMPLEXITY_SIMPLE)
+    assert chat.model.model_name == "summarizer"
+    assert chat.history[0] == "earlier turn"
+    response = chat.send_message({"function_response": []})
+    assert response.parts[0].function_call is None
+    assert response.text == "Có 3 phòng trống."
+
+def test_switch_to_same_model_keeps_session():
+    router, _ = make_router()
+    chat = router.start_chat(STAGE_PLANNER, COMPLEXITY_COMPLEX, history=[])
+    assert chat.model.model_name == "planner-complex"
+    assert router.switch_chat(chat, STAGE_SUMMARIZER, COMPLEXITY_COMPLEX) is chat
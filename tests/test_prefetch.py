@@ -0,0 +1,132 @@
+import asyncio
+import threading
+from datetime import datetime
+
+import pytest
+
+import live_view
+import prefetch
+
+MEETINGS = [
+    {"id": 1, "title": "Daily", "startTime": "2030-01-07T09:00:00", "endTime": "2030-01-07T09:15:00"},
+    {"id": 2, "title": "Review", "startTime": "2030-01-08T14:00:00", "endTime": "2030-01-08T15:00:00", "seriesId": "s-1"},
+]
+NOTIFICATIONS = [{"id": 1, "isRead": False}, {"id": 2, "isRead": True}]
+ROOMS = [{"id": 3, "name": "Sao Hỏa"}, {"id": 4, "name": "Sao Kim"}]
+
+@pytest.fixture
+def sources(monkeypatch):
+    """Snapshot lưu trong _local (không Redis); nguồn dữ liệu giả ghi lại số lần gọi backend."""
+    calls = []
+
+    def source(name, value):
+        def fetch(token):
+            calls.append(name)
+            return value
+        return fetch
+
+    monkeypatch.setattr(prefetch, "redis_client", None)
+    monkeypatch.setattr(prefetch, "_local", {})
+    monkeypatch.setattr(prefetch, "_inflight", {})
+    monkeypatch.setattr(prefetch, "PREFETCH_ENABLED", True)
+    monkeypatch.setattr(live_view, "LIVE_VIEW_ENABLED", False)
+    monkeypatch.setattr(prefetch, "PREFETCH_SOURCES", {
+        "get_my_meetings": source("get_my_meetings", MEETINGS),
+        "get_notifications": source("get_notifications", NOTIFICATIONS),
+        "get_rooms": source("get_rooms", ROOMS),
+    })
+    return calls
+
+def prefetch_then(*calls):
+    """Chạy prefetch cho user rồi lần lượt các tool call (fname, args) trong cùng event loop."""
+    async def scenario():
+        prefetch.start_prefetch("alice-token")
+        await prefetch.get_snapshot("alice-token", wait=5)
+        return [await prefetch.serve("alice-token", fname, args) for fname, args in calls]
+    return asyncio.run(scenario())
+
+def test_meetings_are_served_from_snapshot(sources):
+    (all_served, all_meetings), (day_served, day_meetings), (empty_served, empty) = prefetch_then(
+        ("get_my_meetings", {}),
+        ("get_my_meetings", {"date_filter": "2030-01-08"}),
+        ("get_my_meetings", {"date_filter": "2030-02-01"}),
+    )
+    assert all_served and all_meetings == MEETINGS
+    assert day_served and [m["id"] for m in day_meetings] == [2]
+    assert empty_served and "2030-02-01" in empty
+    assert sources.count("get_my_meetings") == 1
+
+def test_other_tools_are_not_served(sources):
+    assert prefetch_then(("get_meeting_details", {"meeting_id": 1})) == [(False, None)]
+
+def test_errors_are_not_cached(sources, monkeypatch):
+    def broken(token):
+        raise RuntimeError("backend down")
+
+    monkeypatch.setitem(prefetch.PREFETCH_SOURCES, "get_rooms", lambda token: {"error": "502"})
+    monkeypatch.setitem(prefetch.PREFETCH_SOURCES, "get_notifications", broken)
+    rooms, notifications, meetings = prefetch_then(
+        ("get_rooms", {}), ("get_notifications", {}), ("get_my_meetings", {}))
+    assert rooms == (False, None)
+    assert notifications == (False, None)
+    assert meetings == (True, MEETINGS)
+
+def test_invalidate_cancels_inflight_prefetch_and_drops_snapshot(sources, monkeypatch):
+    release = threading.Event()
+
+    def slow_rooms(token):
+        release.wait(5)
+        return ROOMS
+
+    monkeypatch.setitem(prefetch.PREFETCH_SOURCES, "get_rooms", slow_rooms)
+
+    async def scenario():
+        prefetch.start_prefetch("alice-token")
+        task = prefetch._inflight[prefetch.hash_token("alice-token")]
+        await asyncio.sleep(0)
+        prefetch.invalidate("alice-token", "get_rooms")    # Tool chỉ đọc → không làm gì
+        assert not task.cancelled()
+        prefetch.invalidate("alice-token", "create_meeting")
+        release.set()
+        await asyncio.sleep(0)
+        return task
+
+    task = asyncio.run(scenario())
+    assert task.cancelled()
+    assert prefetch._inflight == {} and prefetch._local == {}
+
+def test_invalidate_deletes_saved_snapshot(sources):
+    prefetch_then()
+    assert prefetch._local
+    prefetch.invalidate("alice-token", "cancel_meeting")
+    assert prefetch._local == {}
+    assert asyncio.run(prefetch.serve("alice-token", "get_rooms", {})) == (False, None)
+
+def test_live_view_sources_bypass_snapshot(sources, monkeypatch):
+    monkeypatch.setattr(live_view, "LIVE_VIEW_ENABLED", True)
+    view = [dict(MEETINGS[0], title="Updated by event")]
+    monkeypatch.setattr(live_view, "read_view", lambda token, kind: view if kind == live_view.MEETINGS else None)
+
+    meetings, rooms = prefetch_then(("get_my_meetings", {}), ("get_rooms", {}))
+    # Lịch họp đi qua tool (đọc view), vẫn được gọi lúc prefetch để làm warm view
+    assert meetings == (False, None)
+    assert rooms == (True, ROOMS)
+    assert "get_my_meetings" in sources
+    assert "get_my_meetings" not in next(iter(prefetch._local.values()))
+
+    snapshot = asyncio.run(prefetch.get_snapshot("alice-token"))
+    assert snapshot["get_my_meetings"] == view
+    assert "get_notifications" not in snapshot
+
+def test_build_digest():
+    snapshot = {"get_my_meetings": MEETINGS + [{"id": 3, "startTime": "2030-03-01T09:00:00"}],
+                "get_notifications": NOTIFICATIONS, "get_rooms": ROOMS}
+    digest = prefetch.build_digest(snapshot, now=datetime(2030, 1, 7, 8, 0))
+    assert digest.splitlines() == [
+        "- Lịch họp 7 ngày tới (2):",
+        "  • id=1 | 2030-01-07T09:00:00 → 2030-01-07T09:15:00 | Daily",
+        "  • id=2 | 2030-01-08T14:00:00 → 2030-01-08T15:00:00 | Review, seriesId=s-1",
+        "- Thông báo chưa đọc: 1",
+        "- Phòng họp (id:tên): 3:Sao Hỏa, 4:Sao Kim",
+    ]
+    assert prefetch.build_digest(None) == ""
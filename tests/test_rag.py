@@ -0,0 +1,60 @@
+from rag import chunk_text, count_tokens, select_context, format_context
+
+# 1. CHUNKING
+
+def test_long_single_line_is_split_with_word_overlap():
+    line = " ".join(f"w{i}" for i in range(500))
+    chunks = chunk_text(line, max_tokens=180, overlap_tokens=30, min_tokens=40)
+    assert len(chunks) > 1
+    assert all(count_tokens(c) <= 180 for c in chunks)
+    for previous, current in zip(chunks, chunks[1:]):
+        tail = previous.split()[-30:]
+        assert current.split()[:30] == tail
+    # Không mất từ nào
+    assert {w for c in chunks for w in c.split()} == set(line.split())
+
+def test_short_paragraphs_are_merged_within_a_section():
+    text = "PHẦN 1: QUY TẮC\nDòng một ngắn.\n\nDòng hai ngắn.\n\nPHẦN 2: HỦY LỊCH\nDòng ba."
+    chunks = chunk_text(text, max_tokens=100, overlap_tokens=10, min_tokens=20)
+    assert chunks == ["PHẦN 1: QUY TẮC\nDòng một ngắn.\nDòng hai ngắn.", "PHẦN 2: HỦY LỊCH\nDòng ba."]
+
+def test_chunks_respect_budget_including_heading():
+    body = "\n".join(f"- Quy định số {i}: " + "nội dung " * 8 for i in range(30))
+    chunks = chunk_text("PHẦN 3: CHECK-IN\n" + body, max_tokens=80, overlap_tokens=15, min_tokens=20)
+    assert len(chunks) > 1
+    assert all(c.startswith("PHẦN 3: CHECK-IN\n") for c in chunks)
+    assert all(count_tokens(c) <= 80 for c in chunks)
+
+# 2. SELECTION
+
+DOCS = [
+    "Phải hủy lịch họp trước ít nhất 30 phút so với giờ bắt đầu.",
+    "Phải hủy lịch họp trước ít nhất 30 phút so với giờ bắt đầu cuộc họp.",
+    "Thời gian tối đa cho một cuộc họp là 4 tiếng liên tục.",
+    "Check-in bằng mã QR khi đến phòng họp.",
+]
+METAS = [{"source": "data/policy.txt", "chunk_index": i} for i in range(len(DOCS))]
+
+def test_irrelevant_candidates_are_dropped_by_similarity():
+    selected = select_context("hủy lịch họp", DOCS, METAS, distances=[0.2, 0.22, 0.6, 0.7])
+    assert [m["chunk_index"] for _, m in selected] == [0]   # 1 là bản gần trùng của 0, 2 và 3 kém liên quan
+
+def test_nothing_selected_below_min_similarity():
+    assert select_context("hủy lịch họp", DOCS, METAS, distances=[0.8, 0.8, 0.9, 0.9]) == []
+
+def test_max_chunks_cap():
+    selected = select_context("họp", DOCS, METAS, distances=[0.1, 0.1, 0.1, 0.1], max_chunks=2, max_gap=1.0)
+    assert len(selected) == 2
+
+def test_token_budget_is_respected():
+    selected = select_context("họp", DOCS, METAS, distances=[0.1, 0.1, 0.1, 0.1], token_budget=20, max_gap=1.0)
+    assert sum(count_tokens(d) for d, _ in selected) <= 20
+    assert selected
+
+def test_without_distances_falls_back_to_rank():
+    selected = select_context("phòng họp QR", DOCS, METAS, max_chunks=2)
+    assert len(selected) == 2
+
+def test_format_context_cites_source_and_chunk():
+    text = format_context([(DOCS[2], METAS[2])])
+    assert text.startswith("[1] (nguồn: data/policy.txt, chunk_index 2)\n")
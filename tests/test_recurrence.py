@@ -0,0 +1,162 @@
+import numpy as np
+
+import recurrence
+from recurrence import validate_rule, expand, precheck_series, IntervalIndex
+
+def dates(starts):
+    return [str(d) for d in starts.astype("datetime64[D]")]
+
+# 1. VALIDATE
+
+def test_valid_weekly_rule():
+    rule = {"frequency": "WEEKLY", "interval": 1, "repeatUntil": "2030-02-28", "daysOfWeek": ["MONDAY"]}
+    assert validate_rule(rule, "2030-01-07T09:00:00", "2030-01-07T10:00:00") == []
+
+def test_series_longer_than_six_months_is_rejected():
+    rule = {"frequency": "DAILY", "interval": 1, "repeatUntil": "2030-12-31"}
+    assert validate_rule(rule, "2030-01-07T09:00:00", "2030-01-07T10:00:00")
+
+def test_six_month_limit_counts_calendar_months():
+    # 01/07 → 01/01 là 184 ngày nhưng vẫn đúng 6 tháng
+    assert validate_rule({"frequency": "WEEKLY", "interval": 1, "repeatUntil": "2027-01-01"},
+                         "2026-07-01T09:00:00", "2026-07-01T10:00:00") == []
+    assert validate_rule({"frequency": "WEEKLY", "interval": 1, "repeatUntil": "2027-01-02"},
+                         "2026-07-01T09:00:00", "2026-07-01T10:00:00")
+    # 31/08 + 6 tháng → ngày cuối tháng 2
+    assert validate_rule({"frequency": "DAILY", "interval": 1, "repeatUntil": "2027-02-28"},
+                         "2026-08-31T09:00:00", "2026-08-31T10:00:00") == []
+    assert validate_rule({"frequency": "DAILY", "interval": 1, "repeatUntil": "2027-03-01"},
+                         "2026-08-31T09:00:00", "2026-08-31T10:00:00")
+
+def test_days_of_week_with_daily_is_accepted():
+    rule = {"frequency": "DAILY", "interval": 1, "repeatUntil": "2030-01-20", "daysOfWeek": ["MONDAY", "FRIDAY"]}
+    assert validate_rule(rule, "2030-01-07T09:00:00", "2030-01-07T10:00:00") == []
+
+def test_timezone_suffix_is_rejected_explicitly():
+    rule = {"frequency": "DAILY", "interval": 1, "repeatUntil": "2030-01-20"}
+    errors = validate_rule(rule, "2030-01-07T09:00:00Z", "2030-01-07T10:00:00")
+    assert len(errors) == 1 and "múi giờ" in errors[0]
+    # Lẫn giờ có / không có múi giờ không được raise TypeError
+    assert validate_rule(rule, "2030-01-07T09:00:00", "2030-01-07T10:00:00+07:00")
+
+def test_bad_formats_are_reported():
+    errors = validate_rule({"frequency": "HOURLY", "interval": 0, "repeatUntil": "next week"}, "tomorrow", "2030-01-07T10:00:00")
+    assert len(errors) == 4
+
+# 2. EXPAND
+
+def test_expand_weekly_multiple_days():
+    rule = {"frequency": "WEEKLY", "interval": 1, "repeatUntil": "2030-01-20", "daysOfWeek": ["MONDAY", "WEDNESDAY"]}
+    starts, ends = expand(rule, "2030-01-07T09:00:00", "2030-01-07T10:30:00")
+    assert dates(starts) == ["2030-01-07", "2030-01-09", "2030-01-14", "2030-01-16"]
+    assert str(starts[0]) == "2030-01-07T09:00"
+    assert np.all(ends - starts == np.timedelta64(90, "m"))
+
+def test_expand_every_other_week_defaults_to_start_weekday():
+    rule = {"frequency": "WEEKLY", "interval": 2, "repeatUntil": "2030-02-10"}
+    starts, _ = expand(rule, "2030-01-09T09:00:00", "2030-01-09T10:00:00")
+    assert dates(starts) == ["2030-01-09", "2030-01-23", "2030-02-06"]
+
+def test_expand_daily_with_days_of_week_keeps_selected_days():
+    rule = {"frequency": "DAILY", "interval": 1, "repeatUntil": "2030-01-13", "daysOfWeek": ["SATURDAY", "SUNDAY"]}
+    starts, _ = expand(rule, "2030-01-07T09:00:00", "2030-01-07T10:00:00")
+    assert dates(starts) == ["2030-01-12", "2030-01-13"]
+
+def test_expand_monthly_skips_missing_days():
+    rule = {"frequency": "MONTHLY", "interval": 1, "repeatUntil": "2030-05-31"}
+    starts, _ = expand(rule, "2030-01-31T09:00:00", "2030-01-31T10:00:00")
+    assert dates(starts) == ["2030-01-31", "2030-03-31", "2030-05-31"]
+
+def test_expand_year_long_daily_series():
+    rule = {"frequency": "DAILY", "interval": 1, "repeatUntil": "2030-12-31"}
+    starts, _ = expand(rule, "2030-01-01T09:00:00", "2030-01-01T10:00:00")
+    assert len(starts) == 365
+
+# 3. INTERVAL INDEX
+
+def test_interval_index_overlaps():
+    t = lambda s: np.datetime64(s, "m")
+    index = IntervalIndex(
+        np.array([t("2030-01-07T09:00"), t("2030-01-07T08:00")]),
+        np.array([t("2030-01-07T09:30"), t("2030-01-07T12:00")]),
+        ["short", "long"],
+    )
+    q_starts = np.array([t("2030-01-07T11:00"), t("2030-01-07T12:00"), t("2030-01-07T07:00")])
+    q_ends = np.array([t("2030-01-07T11:30"), t("2030-01-07T13:00"), t("2030-01-07T08:00")])
+    assert index.overlaps(q_starts, q_ends).tolist() == [True, False, False]
+    assert index.conflicts_with(t("2030-01-07T09:15"), t("2030-01-07T09:45")) == ["long", "short"]
+
+# 4. PRE-CHECK
+
+WEEKLY = {"frequency": "WEEKLY", "interval": 1, "repeatUntil": "2030-01-31", "daysOfWeek": ["MONDAY"]}
+
+def meeting(id, start, end, room_id=1, participants=()):
+    return {"id": id, "title": f"M{id}", "startTime": start, "endTime": end,
+            "room": {"id": room_id}, "participants": [{"id": p} for p in participants]}
+
+def test_no_conflict_returns_none():
+    meetings = [meeting(1, "2030-01-08T09:00:00", "2030-01-08T10:00:00")]
+    assert precheck_series(WEEKLY, "2030-01-07T09:00:00", "2030-01-07T10:00:00", meetings, room_id=1) is None
+
+def test_own_calendar_overlap_is_only_a_warning():
+    meetings = [meeting(1, "2030-01-14T09:30:00", "2030-01-14T11:00:00", room_id=7)]
+    result = precheck_series(WEEKLY, "2030-01-07T09:00:00", "2030-01-07T10:00:00", meetings,
+                             room_id=1, participant_ids=[42])
+    assert "error" not in result
+    assert result["overlap_count"] == 1
+    assert result["overlaps"][0]["date"] == "2030-01-14"
+
+def test_room_conflict_blocks():
+    meetings = [meeting(1, "2030-01-21T09:30:00", "2030-01-21T11:00:00", room_id=1)]
+    result = precheck_series(WEEKLY, "2030-01-07T09:00:00", "2030-01-07T10:00:00", meetings, room_id=1)
+    assert result["conflict_count"] == 1
+    assert result["conflicts"][0]["date"] == "2030-01-21"
+    assert "phòng đã được đặt" in result["conflicts"][0]["conflicting"][0]["reasons"]
+
+def test_participant_conflict_blocks():
+    meetings = [meeting(1, "2030-01-07T09:00:00", "2030-01-07T10:00:00", room_id=7, participants=[42])]
+    result = precheck_series(WEEKLY, "2030-01-07T09:00:00", "2030-01-07T10:00:00", meetings,
+                             room_id=1, participant_ids=[42, 43])
+    assert result["conflict_count"] == 1
+
+def test_updated_series_does_not_conflict_with_itself():
+    meetings = [dict(meeting(1, "2030-01-07T09:00:00", "2030-01-07T10:00:00"), seriesId="abc")]
+    assert precheck_series(WEEKLY, "2030-01-07T09:00:00", "2030-01-07T10:00:00", meetings,
+                           room_id=1, exclude_series_id="abc") is None
+
+def test_backend_room_check_blocks_busy_occurrences(monkeypatch):
+    monkeypatch.setattr(recurrence, "RECURRENCE_ROOM_CHECKS", 26)
+    asked = []
+
+    def room_available(start, end):
+        asked.append(start)
+        return start != "2030-01-14T09:00:00"
+
+    result = precheck_series(WEEKLY, "2030-01-07T09:00:00", "2030-01-07T10:00:00", [],
+                             room_id=1, room_available=room_available)
+    assert len(asked) == 4
+    assert result["conflict_count"] == 1
+    assert result["conflicts"][0]["date"] == "2030-01-14"
+
+def test_backend_room_check_is_off_when_disabled(monkeypatch):
+    monkeypatch.setattr(recurrence, "RECURRENCE_ROOM_CHECKS", 0)
+    asked = []
+    result = precheck_series(WEEKLY, "2030-01-07T09:00:00", "2030-01-07T10:00:00", [],
+                             room_id=1, room_available=lambda start, end: asked.append(start))
+    assert result is None and asked == []
+
+def test_backend_room_check_unknown_answer_does_not_block(monkeypatch):
+    monkeypatch.setattr(recurrence, "RECURRENCE_ROOM_CHECKS", 26)
+    result = precheck_series(WEEKLY, "2030-01-07T09:00:00", "2030-01-07T10:00:00", [],
+                             room_id=1, room_available=lambda start, end: None)
+    assert result is None
+
+def test_unexpandable_rule_is_not_blocked():
+    rule = {"frequency": "MONTHLY", "interval": 1, "repeatUntil": "2030-03-31", "daysOfWeek": ["MONDAY"]}
+    result = precheck_series(rule, "2030-01-07T09:00:00", "2030-01-07T10:00:00", [], room_id=1)
+    assert "error" not in result and "warning" in result
+
+def test_invalid_rule_blocks():
+    result = precheck_series({"frequency": "DAILY", "interval": 1, "repeatUntil": "2030-01-20"},
+                             "2030-01-07T09:00:00Z", "2030-01-07T10:00:00", [])
+    assert result["error"] == "Recurrence rule không hợp lệ."
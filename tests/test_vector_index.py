@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+import vector_index
+from vector_index import export_index, NumpyVectorIndex
+
+@pytest.fixture
+def embeddings():
+    return np.random.default_rng(7).standard_normal((10, 16)).astype(np.float32)
+
+def build(path, embeddings, dtype="float16"):
+    ids = [f"policy_{i:04d}" for i in range(len(embeddings))]
+    docs = [f"chunk {i}" for i in range(len(embeddings))]
+    metas = [{"chunk_index": i} for i in range(len(embeddings))]
+    export_index(str(path), ids, docs, embeddings.tolist(), metas, dtype=dtype, extra_meta={"embedding_provider": "hashing:16"})
+    return NumpyVectorIndex(str(path))
+
+@pytest.mark.parametrize("dtype", ["float16", "float32"])
+def test_query_returns_exact_top_k(tmp_path, embeddings, dtype):
+    index = build(tmp_path, embeddings, dtype)
+    assert index.count() == 10
+    assert index.metadata["embedding_provider"] == "hashing:16"
+    assert isinstance(index.matrix, np.memmap)
+
+    query = embeddings[3] + 0.01
+    result = index.query(query_embeddings=[query.tolist()], n_results=3)
+    assert result["ids"][0][0] == "policy_0003"
+    assert result["documents"][0][0] == "chunk 3"
+    assert result["metadatas"][0][0] == {"chunk_index": 3}
+
+    normalized = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    expected = np.argsort(-(normalized @ (query / np.linalg.norm(query))))[:3]
+    assert result["ids"][0] == [f"policy_{i:04d}" for i in expected]
+    distances = result["distances"][0]
+    assert distances == sorted(distances)
+    assert distances[0] == pytest.approx(0.0, abs=1e-2)
+
+def test_blocked_scoring_matches_full_matmul(tmp_path, embeddings, monkeypatch):
+    index = build(tmp_path, embeddings)
+    queries = np.random.default_rng(1).standard_normal((4, 16)).astype(np.float32)
+    full = queries @ np.asarray(index.matrix, dtype=np.float32).T
+    monkeypatch.setattr(vector_index, "QUERY_BLOCK_ROWS", 3)
+    np.testing.assert_allclose(index._scores(queries), full, rtol=1e-5, atol=1e-6)
+
+def test_batch_of_queries(tmp_path, embeddings):
+    index = build(tmp_path, embeddings)
+    result = index.query(query_embeddings=embeddings[[1, 8]].tolist(), n_results=2)
+    assert [ids[0] for ids in result["ids"]] == ["policy_0001", "policy_0008"]
+
+def test_empty_index(tmp_path):
+    export_index(str(tmp_path), [], [], np.zeros((0, 4), dtype=np.float32), [])
+    index = NumpyVectorIndex(str(tmp_path))
+    assert index.query(query_embeddings=[[1.0, 0, 0, 0]], n_results=2) == {
+        "ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]]
+    }
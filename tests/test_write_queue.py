@@ -0,0 +1,134 @@
+import json
+import time
+import base64
+import pytest
+import fakeredis
+
+import write_queue
+from write_queue import (
+    LocalWriteStore, RedisWriteStore, enqueue_write, process_job, drain_write_outcomes,
+    STATUS_QUEUED, STATUS_CONFIRMED, STATUS_FAILED,
+)
+
+def make_token(sub: str = "alice", exp: float = None) -> str:
+    def encode(data):
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).decode().rstrip("=")
+    claims = {"sub": sub, "exp": exp if exp is not None else time.time() + 3600}
+    return f"{encode({'alg': 'HS256'})}.{encode(claims)}.signature"
+
+MEETING_ARGS = {"title": "Sprint review", "start_time": "2030-01-07T09:00:00", "end_time": "2030-01-07T10:00:00", "room_id": 3}
+
+@pytest.fixture
+def calls(monkeypatch):
+    """Thay create_meeting bằng hàm ghi lại các lần gọi backend."""
+    recorded = []
+
+    def fake_create_meeting(token, idempotency_key=None, **kwargs):
+        recorded.append({"token": token, "idempotency_key": idempotency_key, **kwargs})
+        return {"id": len(recorded), "title": kwargs["title"]}
+
+    monkeypatch.setitem(write_queue.available_tools, "create_meeting", fake_create_meeting)
+    return recorded
+
+@pytest.fixture(params=["local", "redis"])
+def store(request, monkeypatch):
+    if request.param == "local":
+        backend = LocalWriteStore()
+    else:
+        backend = RedisWriteStore(fakeredis.FakeRedis(decode_responses=True))
+    monkeypatch.setattr(write_queue, "store", backend)
+    return backend
+
+def run_pending(store):
+    while True:
+        key = store.pop(timeout=0.01)
+        if not key:
+            return
+        process_job(key)
+
+def test_enqueue_returns_queued_then_worker_confirms(store, calls):
+    token = make_token()
+    reply = enqueue_write("create_meeting", {"token": token, **MEETING_ARGS}, scope="turn-1", wait=0)
+    assert reply["status"] == STATUS_QUEUED
+
+    run_pending(store)
+    assert len(calls) == 1
+    assert calls[0]["idempotency_key"] == reply["idempotency_key"]
+
+    outcomes = drain_write_outcomes(token)
+    assert [o["status"] for o in outcomes] == [STATUS_CONFIRMED]
+    assert "token" not in outcomes[0]["args"]
+    # Job đã xong không còn giữ token
+    assert store.get(reply["idempotency_key"])["args"] == {}
+
+def test_retry_in_same_turn_is_deduplicated(store, calls):
+    token = make_token()
+    first = enqueue_write("create_meeting", {"token": token, **MEETING_ARGS}, scope="turn-1", wait=0)
+    second = enqueue_write("create_meeting", {"token": token, **MEETING_ARGS}, scope="turn-1", wait=0)
+    assert second["idempotency_key"] == first["idempotency_key"]
+    assert second["duplicate"] is True
+    run_pending(store)
+    assert len(calls) == 1
+
+def test_same_write_in_later_turn_is_a_new_job(store, calls):
+    # Tạo X, hủy X, rồi tạo lại X ở lượt sau → phải gửi xuống backend lần nữa
+    token = make_token()
+    first = enqueue_write("create_meeting", {"token": token, **MEETING_ARGS}, scope="turn-1", wait=0)
+    run_pending(store)
+    second = enqueue_write("create_meeting", {"token": token, **MEETING_ARGS}, scope="turn-2", wait=0)
+    assert second["idempotency_key"] != first["idempotency_key"]
+    assert "duplicate" not in second
+    run_pending(store)
+    assert len(calls) == 2
+
+def test_without_scope_every_call_is_new(store, calls):
+    token = make_token()
+    first = enqueue_write("create_meeting", {"token": token, **MEETING_ARGS}, wait=0)
+    second = enqueue_write("create_meeting", {"token": token, **MEETING_ARGS}, wait=0)
+    assert first["idempotency_key"] != second["idempotency_key"]
+
+def test_expired_token_is_not_enqueued(store, calls):
+    token = make_token(exp=time.time() - 10)
+    reply = enqueue_write("create_meeting", {"token": token, **MEETING_ARGS}, scope="turn-1", wait=0)
+    assert reply["status"] == STATUS_FAILED
+    run_pending(store)
+    assert calls == []
+
+def test_job_whose_token_expired_while_queued_is_not_sent(store, calls):
+    token = make_token()
+    reply = enqueue_write("create_meeting", {"token": token, **MEETING_ARGS}, scope="turn-1", wait=0)
+    store.update(reply["idempotency_key"], token_expires_at=time.time() - 1)
+
+    run_pending(store)
+    assert calls == []
+    job = store.get(reply["idempotency_key"])
+    assert job["status"] == STATUS_FAILED
+    assert job["args"] == {}
+    assert [o["status"] for o in drain_write_outcomes(token)] == [STATUS_FAILED]
+
+def test_redis_job_ttl_is_bounded_by_token_expiry(monkeypatch, calls):
+    client = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(write_queue, "store", RedisWriteStore(client))
+    token = make_token(exp=time.time() + 60)
+    reply = enqueue_write("create_meeting", {"token": token, **MEETING_ARGS}, scope="turn-1", wait=0)
+    assert 0 < client.ttl(f"write_job:{reply['idempotency_key']}") <= 60
+
+def test_recover_stale_does_not_replay_expired_jobs(monkeypatch, calls):
+    client = fakeredis.FakeRedis(decode_responses=True)
+    backend = RedisWriteStore(client)
+    monkeypatch.setattr(write_queue, "store", backend)
+    token = make_token()
+    reply = enqueue_write("create_meeting", {"token": token, **MEETING_ARGS}, scope="turn-1", wait=0)
+    key = reply["idempotency_key"]
+
+    # Worker lấy job rồi chết; khi khôi phục token đã hết hạn
+    assert backend.pop(timeout=0.01) == key
+    stale = time.time() - write_queue.WRITE_JOB_STALE_SECONDS - 1
+    job = dict(backend.get(key), status="running", updated_at=stale, token_expires_at=time.time() - 1)
+    client.set(f"write_job:{key}", json.dumps(job))
+
+    backend.recover_stale()
+    assert client.llen(RedisWriteStore.PENDING) == 0
+    assert client.llen(RedisWriteStore.PROCESSING) == 0
+    assert backend.get(key)["status"] == STATUS_FAILED
+    assert calls == []
@@ -1,12 +1,12 @@
 import requests
 import os
-import chromadb
-import google.generativeai as genai
+from functools import lru_cache
 from dotenv import load_dotenv
+from rag import RAG_CANDIDATES, select_context, format_context
+import live_view
 
 # 1. Cấu hình môi trường & URL chuẩn hóa
 load_dotenv()
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
 # --- LOGIC XỬ LÝ URL THÔNG MINH ---
 # Đảm bảo URL luôn kết thúc đúng chuẩn /api/v1 bất kể cấu hình .env thế nào
@@ -20,24 +20,63 @@ else:
 
 print(f"[INFO] Tools connected to: {API_BASE_URL}")
 
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
-
 # --- RAG Configuration ---
+# POLICY_BACKEND=chroma (mặc định) hoặc numpy (index mmap do ingest.py xuất ra, xem vector_index.py)
+POLICY_BACKEND = os.getenv("POLICY_BACKEND", "chroma").lower()
+VECTOR_INDEX_PATH = os.getenv("VECTOR_INDEX_PATH", "./vector_index")
+
 policy_collection = None
-try:
-    chroma_client = chromadb.PersistentClient(path="./chroma_db")
-    policy_collection = chroma_client.get_or_create_collection(name="meeting_policies")
-except Exception as e:
-    print(f"[WARN] ChromaDB connection failed. RAG features disabled. Error: {e}")
+if POLICY_BACKEND == "numpy":
+    try:
+        from vector_index import NumpyVectorIndex
+        policy_collection = NumpyVectorIndex(VECTOR_INDEX_PATH)
+        print(f"[INFO] Policy index loaded (numpy): {policy_collection.count()} chunks")
+    except Exception as e:
+        print(f"[WARN] Numpy vector index not available. RAG features disabled. Error: {e}")
+else:
+    try:
+        import chromadb
+        chroma_client = chromadb.PersistentClient(path="./chroma_db")
+        policy_collection = chroma_client.get_or_create_collection(name="meeting_policies")
+    except Exception as e:
+        print(f"[WARN] ChromaDB connection failed. RAG features disabled. Error: {e}")
 
-def _get_headers(token: str):
+# Provider embedding lúc query phải trùng với lúc ingest (ghi trong metadata của collection/index)
+embedding_provider = None
+if policy_collection is not None:
+    try:
+        from embeddings import get_provider, METADATA_KEY
+        embedding_provider = get_provider()
+        indexed_with = (policy_collection.metadata or {}).get(METADATA_KEY, "gemini:models/text-embedding-004")
+        if indexed_with != embedding_provider.name:
+            print(f"[WARN] Policy index was built with '{indexed_with}' but EMBEDDING_PROVIDER is "
+                  f"'{embedding_provider.name}'. Re-run ingest.py. RAG features disabled.")
+            policy_collection = None
+    except Exception as e:
+        print(f"[WARN] Embedding provider init failed. RAG features disabled. Error: {e}")
+        policy_collection = None
+
+# Khoảng cách trả về: index NumPy luôn là cosine; Chroma theo "hnsw:space" lúc ingest (mặc định l2)
+POLICY_DISTANCE_SPACE = "cosine"
+if policy_collection is not None and POLICY_BACKEND != "numpy":
+    POLICY_DISTANCE_SPACE = (policy_collection.metadata or {}).get("hnsw:space", "l2")
+
+@lru_cache(maxsize=256)
+def _embed_policy_query(query: str):
+    """Cache embedding của câu hỏi: các request (vd: item trong cùng một batch) hỏi giống nhau chỉ embed một lần."""
+    return tuple(embedding_provider.embed_query(query))
+
+def _get_headers(token: str, idempotency_key: str = None):
     if not token.startswith("Bearer "):
         token = f"Bearer {token}"
-    return {
+    headers = {
         "Authorization": token,
         "Content-Type": "application/json"
     }
+    # Thao tác ghi đi qua write_queue luôn kèm key để backend bỏ qua request lặp lại
+    if idempotency_key:
+        headers["Idempotency-Key"] = idempotency_key
+    return headers
 
 # --- Retrieval Tools (Các hàm tra cứu) ---
 
@@ -47,20 +86,23 @@ def search_policy(token: str, query: str):
         return "Policy search service is unavailable."
     
     try:
-        query_embedding = genai.embed_content(
-            model="models/text-embedding-004",
-            content=query,
-            task_type="retrieval_query"
-        )['embedding']
+        query_embedding = _embed_policy_query(query)
         
+        # Lấy nhiều ứng viên rồi dedup + rerank + cắt theo token budget (xem rag.py)
         results = policy_collection.query(
             query_embeddings=[query_embedding],
-            n_results=2
+            n_results=RAG_CANDIDATES
         )
         
         if results['documents'] and results['documents'][0]:
-            context = "\n---\n".join(results['documents'][0])
-            return f"Relevant policy documents:\n{context}"
+            metadatas = (results.get('metadatas') or [[]])[0] or [{}] * len(results['documents'][0])
+            distances = (results.get('distances') or [None])[0]
+            if distances and POLICY_DISTANCE_SPACE == "l2":
+                # Collection cũ (Chroma mặc định l2², vector đã chuẩn hóa): l2² = 2 - 2·cos
+                distances = [d / 2 for d in distances]
+            selected = select_context(query, results['documents'][0], metadatas, distances)
+            if selected:
+                return f"Relevant policy documents:\n{format_context(selected)}"
         return "No relevant policy found."
     except Exception as e:
         return f"Error searching policy: {str(e)}"
@@ -74,6 +116,15 @@ def search_users(token: str, query: str):
     except Exception as e:
         return {"error": str(e)}
 
+def get_current_user(token: str):
+    """User sở hữu token (backend verify chữ ký JWT). Dùng làm định danh cho live_view."""
+    url = f"{API_BASE_URL}/users/me"
+    try:
+        response = requests.get(url, headers=_get_headers(token))
+        return response.json() if response.status_code == 200 else {"error": response.text}
+    except Exception as e:
+        return {"error": str(e)}
+
 def get_rooms(token: str):
     url = f"{API_BASE_URL}/rooms"
     try:
@@ -99,42 +150,77 @@ def find_available_rooms(token: str, start_time: str, end_time: str, capacity: i
     except Exception as e:
         return {"error": str(e)}
 
-def get_my_meetings(token: str, date_filter: str = None):
-    """
-    Xem lịch họp của tôi.
-    Args:
-        token: JWT Token
-        date_filter: (Optional) Ngày cần lọc (Format: YYYY-MM-DD). Ví dụ: '2025-11-29'.
-    """
+def is_room_available(token: str, room_id: int, start_time: str, end_time: str):
+    """True / False nếu backend trả lời được, None nếu lỗi (không kết luận được)."""
+    rooms = find_available_rooms(token, start_time, end_time, capacity=1)
+    if not isinstance(rooms, list):
+        return None
+    return any(isinstance(r, dict) and r.get("id") == room_id for r in rooms)
+
+def filter_meetings_by_date(meetings: list, date_filter: str):
+    """Lọc danh sách cuộc họp theo ngày (YYYY-MM-DD). Dùng chung cho get_my_meetings và prefetch."""
+    filtered_meetings = []
+    for m in meetings:
+        # startTime dạng "2025-11-29T09:00:00"
+        start_time = m.get("startTime", "")
+        if start_time.startswith(date_filter):
+            filtered_meetings.append(m)
+    
+    if not filtered_meetings:
+        return f"Hệ thống: Không tìm thấy lịch họp nào của bạn vào ngày {date_filter}."
+    
+    return filtered_meetings
+
+def _fetch_my_meetings(token: str):
     url = f"{API_BASE_URL}/meetings/my-meetings"
     try:
         # Lấy số lượng lớn một chút để đảm bảo lọc được ngày cần tìm
         response = requests.get(url, headers=_get_headers(token), params={"size": 50})
-        
         if response.status_code == 200:
-            data = response.json()
-            meetings = data.get("content", [])
-            
-            # --- LOGIC LỌC THEO NGÀY (NẾU CÓ) ---
-            if date_filter:
-                filtered_meetings = []
-                for m in meetings:
-                    # startTime dạng "2025-11-29T09:00:00"
-                    start_time = m.get("startTime", "")
-                    if start_time.startswith(date_filter):
-                        filtered_meetings.append(m)
-                
-                if not filtered_meetings:
-                    return f"Hệ thống: Không tìm thấy lịch họp nào của bạn vào ngày {date_filter}."
-                
-                return filtered_meetings
-            
-            return meetings
-            
+            return response.json().get("content", [])
         return {"error": response.text}
     except Exception as e:
         return {"error": str(e)}
 
+MEETINGS_PAGE_SIZE = int(os.getenv("MEETINGS_PAGE_SIZE", 100))
+MEETINGS_MAX_PAGES = int(os.getenv("MEETINGS_MAX_PAGES", 20))
+
+def fetch_all_my_meetings(token: str):
+    """Toàn bộ lịch họp của user (duyệt hết các trang), dùng cho kiểm tra trùng lịch của chuỗi dài."""
+    url = f"{API_BASE_URL}/meetings/my-meetings"
+    meetings = []
+    try:
+        for page in range(MEETINGS_MAX_PAGES):
+            response = requests.get(url, headers=_get_headers(token), params={"page": page, "size": MEETINGS_PAGE_SIZE})
+            if response.status_code != 200:
+                return {"error": response.text}
+            data = response.json()
+            content = data.get("content", [])
+            meetings.extend(content)
+            if data.get("last", True) or not content:
+                break
+        return meetings
+    except Exception as e:
+        return {"error": str(e)}
+
+def get_my_meetings(token: str, date_filter: str = None):
+    """
+    Xem lịch họp của tôi.
+    Args:
+        token: JWT Token
+        date_filter: (Optional) Ngày cần lọc (Format: YYYY-MM-DD). Ví dụ: '2025-11-29'.
+    """
+    # Đọc từ view do backend đẩy sự kiện cập nhật; chỉ gọi backend khi view cold (xem live_view.py)
+    meetings = live_view.read_or_fetch(token, live_view.MEETINGS, lambda: _fetch_my_meetings(token))
+    if not isinstance(meetings, list):
+        return meetings
+    
+    # --- LOGIC LỌC THEO NGÀY (NẾU CÓ) ---
+    if date_filter:
+        return filter_meetings_by_date(meetings, date_filter)
+    
+    return meetings
+
 def get_meeting_details(token: str, meeting_id: int):
     url = f"{API_BASE_URL}/meetings/{meeting_id}"
     try:
@@ -143,7 +229,7 @@ def get_meeting_details(token: str, meeting_id: int):
     except Exception as e:
         return {"error": str(e)}
 
-def get_notifications(token: str):
+def _fetch_notifications(token: str):
     url = f"{API_BASE_URL}/notifications"
     try:
         response = requests.get(url, headers=_get_headers(token))
@@ -153,6 +239,9 @@ def get_notifications(token: str):
     except Exception as e:
         return {"error": str(e)}
 
+def get_notifications(token: str):
+    return live_view.read_or_fetch(token, live_view.NOTIFICATIONS, lambda: _fetch_notifications(token))
+
 def get_contact_groups(token: str):
     url = f"{API_BASE_URL}/contact-groups"
     try:
@@ -189,7 +278,7 @@ def find_available_devices(token: str, start_time: str, end_time: str):
 
 def create_meeting(token: str, title: str, start_time: str, end_time: str, room_id: int, 
                    participant_ids: list[int] = [], description: str = "", 
-                   device_ids: list[int] = [], recurrence: dict = None):
+                   device_ids: list[int] = [], recurrence: dict = None, idempotency_key: str = None):
     url = f"{API_BASE_URL}/meetings"
     payload = {
         "title": title, "description": description,
@@ -205,21 +294,21 @@ def create_meeting(token: str, title: str, start_time: str, end_time: str, room_
     try:
         # Debug log
         print(f"DEBUG: Creating meeting at {url} with payload: {payload}")
-        response = requests.post(url, headers=_get_headers(token), json=payload)
+        response = requests.post(url, headers=_get_headers(token, idempotency_key), json=payload)
         return response.json() if response.status_code in [200, 201] else {"error": response.text}
     except Exception as e:
         return {"error": str(e)}
 
-def cancel_meeting(token: str, meeting_id: int, reason: str):
+def cancel_meeting(token: str, meeting_id: int, reason: str, idempotency_key: str = None):
     url = f"{API_BASE_URL}/meetings/{meeting_id}"
     try:
-        response = requests.request("DELETE", url, headers=_get_headers(token), json={"reason": reason})
+        response = requests.request("DELETE", url, headers=_get_headers(token, idempotency_key), json={"reason": reason})
         return {"success": True, "message": "Cancelled successfully."} if response.status_code == 200 else {"error": response.text}
     except Exception as e:
         return {"error": str(e)}
 
 def update_meeting(token: str, meeting_id: int, title: str, start_time: str, end_time: str, room_id: int, 
-                   participant_ids: list[int], description: str = ""):
+                   participant_ids: list[int], description: str = "", idempotency_key: str = None):
     url = f"{API_BASE_URL}/meetings/{meeting_id}"
     payload = {
         "title": title, "description": description,
@@ -228,7 +317,7 @@ def update_meeting(token: str, meeting_id: int, title: str, start_time: str, end
         "deviceIds": [], "guestEmails": []
     }
     try:
-        response = requests.put(url, headers=_get_headers(token), json=payload)
+        response = requests.put(url, headers=_get_headers(token, idempotency_key), json=payload)
         return response.json() if response.status_code == 200 else {"error": response.text}
     except Exception as e:
         return {"error": str(e)}
@@ -260,7 +349,8 @@ def check_in_by_qr(token: str, qr_code: str):
         return {"error": str(e)}
 
 def update_meeting_series(token: str, series_id: str, title: str, start_time: str, end_time: str, 
-                          room_id: int, participant_ids: list[int], description: str = "", recurrence: dict = None):
+                          room_id: int, participant_ids: list[int], description: str = "", recurrence: dict = None,
+                          idempotency_key: str = None):
     """Cập nhật toàn bộ CHUỖI lịch định kỳ."""
     url = f"{API_BASE_URL}/meetings/series/{series_id}"
     payload = {
@@ -273,16 +363,16 @@ def update_meeting_series(token: str, series_id: str, title: str, start_time: st
         payload["recurrenceRule"] = recurrence
     
     try:
-        response = requests.put(url, headers=_get_headers(token), json=payload)
+        response = requests.put(url, headers=_get_headers(token, idempotency_key), json=payload)
         return response.json() if response.status_code == 200 else {"error": response.text}
     except Exception as e:
         return {"error": str(e)}
 
-def cancel_meeting_series(token: str, series_id: str, reason: str):
+def cancel_meeting_series(token: str, series_id: str, reason: str, idempotency_key: str = None):
     """Hủy toàn bộ CHUỖI lịch định kỳ."""
     url = f"{API_BASE_URL}/meetings/series/{series_id}"
     try:
-        response = requests.request("DELETE", url, headers=_get_headers(token), json={"reason": reason})
+        response = requests.request("DELETE", url, headers=_get_headers(token, idempotency_key), json={"reason": reason})
         return {"success": True, "message": "Đã hủy chuỗi thành công."} if response.status_code == 200 else {"error": response.text}
     except Exception as e:
         return {"error": str(e)}
@@ -0,0 +1,108 @@
+"""
+Vector index in-memory (NumPy) thay thế cho Chroma khi tra cứu chính sách.
+
+Bộ chính sách rất nhỏ (vài chục đoạn) nên tìm kiếm chính xác (exact top-k) bằng một phép nhân
+ma trận là đủ nhanh, không cần Chroma PersistentClient (import + mở DB nặng, overhead mỗi query).
+
+Định dạng trên disk (thư mục VECTOR_INDEX_PATH):
+- embeddings.npy : ma trận (N, D) float16/float32, mỗi dòng đã chuẩn hóa L2 → dot product = cosine
+- documents.json : [{"id", "document", "metadata"}, ...] theo đúng thứ tự dòng
+- meta.json      : số chiều, dtype, thông tin khác
+
+Ma trận được mở bằng np.load(mmap_mode="r") → load tức thì, các worker process dùng chung page cache.
+Khi query, ma trận float16 được đổi sang float32 theo từng khối QUERY_BLOCK_ROWS dòng (bộ nhớ tạm có giới hạn),
+không tạo bản sao float32 của cả index trong mỗi process.
+"""
+
+import os
+import json
+import numpy as np
+
+EMBEDDINGS_FILE = "embeddings.npy"
+DOCUMENTS_FILE = "documents.json"
+META_FILE = "meta.json"
+
+QUERY_BLOCK_ROWS = int(os.getenv("VECTOR_QUERY_BLOCK_ROWS", 4096))
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+# 1. EXPORT (dùng trong ingest.py)
+
+def export_index(path: str, ids: list, documents: list, embeddings: list, metadatas: list,
+                 dtype: str = "float16", extra_meta: dict = None) -> None:
+    """Ghi index ra disk. Ghi file tạm rồi rename để worker đang đọc không thấy file dở dang."""
+    os.makedirs(path, exist_ok=True)
+    matrix = _normalize(np.asarray(embeddings, dtype=np.float32)).astype(dtype)
+
+    tmp_npy = os.path.join(path, EMBEDDINGS_FILE + ".tmp.npy")
+    np.save(tmp_npy, matrix)
+    os.replace(tmp_npy, os.path.join(path, EMBEDDINGS_FILE))
+
+    records = [{"id": i, "document": d, "metadata": m} for i, d, m in zip(ids, documents, metadatas)]
+    _write_json(os.path.join(path, DOCUMENTS_FILE), records)
+
+    meta = {"count": int(matrix.shape[0]), "dim": int(matrix.shape[1]) if matrix.ndim == 2 else 0, "dtype": dtype}
+    meta.update(extra_meta or {})
+    _write_json(os.path.join(path, META_FILE), meta)
+
+def _write_json(file_path: str, data) -> None:
+    tmp = file_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, file_path)
+
+# 2. LOAD & QUERY
+
+class NumpyVectorIndex:
+    """Giao diện query() giống Chroma collection để tools.search_policy dùng chung một code path."""
+    def __init__(self, path: str):
+        self.path = path
+        self.matrix = np.load(os.path.join(path, EMBEDDINGS_FILE), mmap_mode="r")
+        with open(os.path.join(path, DOCUMENTS_FILE), "r", encoding="utf-8") as f:
+            records = json.load(f)
+        meta_path = os.path.join(path, META_FILE)
+        self.metadata = {}
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                self.metadata = json.load(f)
+        self.ids = [r["id"] for r in records]
+        self.documents = [r["document"] for r in records]
+        self.metadatas = [r.get("metadata") or {} for r in records]
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    def _scores(self, queries: np.ndarray) -> np.ndarray:
+        """Cosine (Q x N). Nhân theo khối để matmul float32 (BLAS) mà không copy cả ma trận mmap."""
+        n = self.matrix.shape[0]
+        scores = np.empty((len(queries), n), dtype=np.float32)
+        for start in range(0, n, QUERY_BLOCK_ROWS):
+            block = self.matrix[start:start + QUERY_BLOCK_ROWS]
+            scores[:, start:start + len(block)] = queries @ block.astype(np.float32, copy=False).T
+        return scores
+
+    def query(self, query_embeddings: list, n_results: int = 2, **kwargs) -> dict:
+        """
+        Exact top-k theo cosine. Nhiều query → một phép matmul (Q x D) @ (D x N).
+        Trả về dict cùng format với Chroma: ids / documents / metadatas / distances (1 - cosine).
+        """
+        queries = _normalize(np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32)))
+        k = min(n_results, len(self.ids))
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        if k == 0:
+            for key in result:
+                result[key] = [[] for _ in range(len(queries))]
+            return result
+
+        scores = self._scores(queries)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        for row, candidates in enumerate(top):
+            order = candidates[np.argsort(-scores[row, candidates])]
+            result["ids"].append([self.ids[i] for i in order])
+            result["documents"].append([self.documents[i] for i in order])
+            result["metadatas"].append([self.metadatas[i] for i in order])
+            result["distances"].append([float(1.0 - scores[row, i]) for i in order])
+        return result
@@ -0,0 +1,346 @@
+"""
+Hàng đợi ghi bất đồng bộ cho các thao tác thay đổi lịch họp.
+
+create_meeting / update_meeting / cancel_meeting / update_meeting_series / cancel_meeting_series
+không còn chạy đồng bộ trong vòng lặp LLM:
+- Mỗi thao tác có một idempotency key sinh phía client (băm từ user + lượt chat + tool + tham số)
+  → model gọi lại cùng thao tác trong cùng lượt chat sẽ không tạo trùng cuộc họp; cùng thao tác ở
+  lượt sau (vd: tạo lại cuộc họp vừa hủy) là một yêu cầu mới. Key cũng được gửi sang backend
+  qua header Idempotency-Key.
+- Job còn chứa token của user chỉ được giữ tới khi token hết hạn; job có token đã hết hạn
+  không được gửi xuống backend (kể cả khi khôi phục job kẹt).
+- Job được lưu bền vững trong Redis (list + hash trạng thái). Không có Redis → dùng hàng đợi
+  cục bộ trong process (stand-in cho môi trường dev/test).
+- Model nhận ngay trạng thái "queued" (hoặc "confirmed" nếu backend trả về kịp trong WRITE_SYNC_WAIT giây).
+- Kết quả cuối cùng được đẩy vào hộp thông báo của user: GET /api/chat/writes, và được chèn vào
+  lượt chat tiếp theo để trợ lý báo lại cho user.
+"""
+
+import os
+import json
+import time
+import uuid
+import queue
+import hashlib
+import threading
+from dotenv import load_dotenv
+from redis_store import redis_client, hash_token, token_expiry
+from tools import available_tools
+import live_view
+
+load_dotenv()
+
+# 1. CẤU HÌNH
+
+WRITE_TOOLS = {
+    "create_meeting", "update_meeting", "cancel_meeting",
+    "update_meeting_series", "cancel_meeting_series",
+}
+
+WRITE_QUEUE_BACKEND = os.getenv("WRITE_QUEUE_BACKEND", "auto")          # auto | redis | local
+WRITE_WORKERS = int(os.getenv("WRITE_WORKERS", 2))                       # Số thread xử lý job / process
+WRITE_SYNC_WAIT = float(os.getenv("WRITE_SYNC_WAIT", 2.0))               # Chờ tối đa trước khi trả "queued"
+WRITE_JOB_TTL = int(os.getenv("WRITE_JOB_TTL", 3600))                    # Thời gian giữ trạng thái job
+WRITE_JOB_STALE_SECONDS = int(os.getenv("WRITE_JOB_STALE_SECONDS", 300)) # Job "running" quá lâu → coi như worker chết
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_CONFIRMED = "confirmed"
+STATUS_FAILED = "failed"
+
+TOKEN_EXPIRED_ERROR = "Phiên đăng nhập đã hết hạn trước khi thao tác được xử lý. Vui lòng đăng nhập lại và thử lại."
+
+def make_idempotency_key(user_token: str, fname: str, args: dict, scope: str) -> str:
+    """
+    Cùng user + cùng scope (lượt chat) + cùng tool + cùng tham số → cùng key.
+    Scope là Idempotency-Key client gửi kèm /api/chat (gửi lại request không ghi trùng),
+    không có thì là id ngẫu nhiên của lượt: chỉ chống trùng khi model gọi lại trong cùng lượt.
+    """
+    canonical = json.dumps({k: v for k, v in args.items() if k != "token"}, sort_keys=True, ensure_ascii=False, default=str)
+    raw = f"{hash_token(user_token)}:{scope}:{fname}:{canonical}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+def _token_expired(job: dict, now: float = None) -> bool:
+    expires_at = job.get("token_expires_at")
+    return bool(expires_at) and expires_at <= (now or time.time())
+
+def _job_ttl(job: dict) -> int:
+    """Job còn giữ token → không lưu quá thời điểm token hết hạn."""
+    expires_at = job.get("token_expires_at")
+    if not (job.get("args") or {}).get("token") or not expires_at:
+        return WRITE_JOB_TTL
+    return max(1, min(WRITE_JOB_TTL, int(expires_at - time.time())))
+
+# 2. STORAGE BACKENDS
+
+class RedisWriteStore:
+    """Job lưu trong Redis: hash trạng thái + list chờ + list đang xử lý (để khôi phục khi worker chết)."""
+    PENDING = "write_queue:pending"
+    PROCESSING = "write_queue:processing"
+
+    def __init__(self, client):
+        self.client = client
+
+    def _job_key(self, key): return f"write_job:{key}"
+    def _outbox_key(self, user_hash): return f"write_outbox:{user_hash}"
+
+    def reserve(self, key: str, job: dict):
+        """Tạo job nếu chưa có. Trả về job cũ nếu key đã tồn tại (trùng)."""
+        created = self.client.set(self._job_key(key), json.dumps(job), nx=True, ex=_job_ttl(job))
+        if created:
+            self.client.lpush(self.PENDING, key)
+            return None
+        return self.get(key)
+
+    def push(self, key: str):
+        self.client.lpush(self.PENDING, key)
+
+    def pop(self, timeout: float):
+        return self.client.blmove(self.PENDING, self.PROCESSING, timeout, "RIGHT", "LEFT")
+
+    def get(self, key: str):
+        data = self.client.get(self._job_key(key))
+        return json.loads(data) if data else None
+
+    def update(self, key: str, **fields):
+        job = self.get(key) or {}
+        job.update(fields, updated_at=time.time())
+        self.client.set(self._job_key(key), json.dumps(job), ex=_job_ttl(job))
+        return job
+
+    def ack(self, key: str):
+        self.client.lrem(self.PROCESSING, 1, key)
+
+    def recover_stale(self):
+        """Đưa lại vào hàng đợi các job kẹt ở trạng thái running quá lâu (trừ job có token đã hết hạn)."""
+        now = time.time()
+        for key in self.client.lrange(self.PROCESSING, 0, -1):
+            job = self.get(key)
+            if not job:
+                self.ack(key)
+            elif job.get("status") in (STATUS_QUEUED, STATUS_RUNNING) and now - job.get("updated_at", now) > WRITE_JOB_STALE_SECONDS:
+                if _token_expired(job, now):
+                    _expire_job(key, job)
+                    continue
+                self.update(key, status=STATUS_QUEUED)
+                self.ack(key)
+                self.client.lpush(self.PENDING, key)
+
+    def publish_outcome(self, user_hash: str, outcome: dict):
+        self.client.rpush(self._outbox_key(user_hash), json.dumps(outcome, ensure_ascii=False, default=str))
+        self.client.expire(self._outbox_key(user_hash), WRITE_JOB_TTL)
+
+    def drain_outcomes(self, user_hash: str):
+        pipe = self.client.pipeline()
+        pipe.lrange(self._outbox_key(user_hash), 0, -1)
+        pipe.delete(self._outbox_key(user_hash))
+        items, _ = pipe.execute()
+        return [json.loads(i) for i in items]
+
+class LocalWriteStore:
+    """Stand-in trong process (không bền vững) khi không có Redis."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._pending = queue.Queue()
+        self._outbox = {}
+
+    def reserve(self, key: str, job: dict):
+        with self._lock:
+            existing = self._jobs.get(key)
+            if existing and time.time() - existing.get("created_at", 0) < WRITE_JOB_TTL:
+                return dict(existing)
+            self._jobs[key] = dict(job)
+        self._pending.put(key)
+        return None
+
+    def push(self, key: str):
+        self._pending.put(key)
+
+    def pop(self, timeout: float):
+        try:
+            return self._pending.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def get(self, key: str):
+        with self._lock:
+            job = self._jobs.get(key)
+            return dict(job) if job else None
+
+    def update(self, key: str, **fields):
+        with self._lock:
+            job = self._jobs.setdefault(key, {})
+            job.update(fields, updated_at=time.time())
+            return dict(job)
+
+    def ack(self, key: str):
+        pass
+
+    def recover_stale(self):
+        pass
+
+    def publish_outcome(self, user_hash: str, outcome: dict):
+        with self._lock:
+            self._outbox.setdefault(user_hash, []).append(outcome)
+
+    def drain_outcomes(self, user_hash: str):
+        with self._lock:
+            return self._outbox.pop(user_hash, [])
+
+def _create_store():
+    if WRITE_QUEUE_BACKEND == "local" or (WRITE_QUEUE_BACKEND == "auto" and not redis_client):
+        print("[INFO] Write queue: local in-process store")
+        return LocalWriteStore()
+    if not redis_client:
+        raise RuntimeError("WRITE_QUEUE_BACKEND=redis nhưng không kết nối được Redis")
+    print("[INFO] Write queue: Redis")
+    return RedisWriteStore(redis_client)
+
+store = _create_store()
+
+# 3. WORKER
+
+def _is_error(result) -> bool:
+    return isinstance(result, dict) and "error" in result
+
+def _summarize(job: dict, result) -> dict:
+    return {
+        "idempotency_key": job["idempotency_key"],
+        "tool": job["tool"],
+        "status": STATUS_FAILED if _is_error(result) else STATUS_CONFIRMED,
+        "args": {k: v for k, v in job["args"].items() if k != "token"},
+        "result": result,
+    }
+
+def _finish(key: str, job: dict, result):
+    outcome = _summarize(job, result)
+    store.update(key, status=outcome["status"], result=result, args={})  # Xóa token khỏi job đã xong
+    store.publish_outcome(job["user"], outcome)
+    store.ack(key)
+    return outcome
+
+def _expire_job(key: str, job: dict):
+    """Token hết hạn khi job còn chờ → không gửi xuống backend, báo lỗi cho user."""
+    _finish(key, job, {"error": TOKEN_EXPIRED_ERROR})
+    print(f"📝 [Write Queue] {job['tool']} {key[:8]} → token expired, not sent")
+
+def process_job(key: str):
+    job = store.get(key)
+    if not job or job.get("status") in (STATUS_CONFIRMED, STATUS_FAILED):
+        store.ack(key)
+        return
+    if _token_expired(job):
+        _expire_job(key, job)
+        return
+    store.update(key, status=STATUS_RUNNING)
+
+    func = available_tools[job["tool"]]
+    try:
+        result = func(**job["args"], idempotency_key=key)
+    except Exception as e:
+        result = {"error": str(e)}
+
+    live_view.invalidate(job["args"]["token"])   # Không chờ sự kiện từ backend cho thay đổi của chính user
+    outcome = _finish(key, job, result)
+    print(f"📝 [Write Queue] {job['tool']} {key[:8]} → {outcome['status']}")
+
+def _worker_loop(stop: threading.Event):
+    while not stop.is_set():
+        try:
+            key = store.pop(timeout=1)
+            if key:
+                process_job(key)
+        except Exception as e:
+            print(f"[ERROR] Write worker: {e}")
+            time.sleep(1)
+
+_stop_event = threading.Event()
+_workers = []
+
+def start_workers():
+    """Gọi khi khởi động app (main.py)."""
+    if _workers:
+        return
+    _stop_event.clear()
+    try:
+        store.recover_stale()
+    except Exception as e:
+        print(f"[WARN] Write queue recovery failed: {e}")
+    for i in range(WRITE_WORKERS):
+        t = threading.Thread(target=_worker_loop, args=(_stop_event,), name=f"write-worker-{i}", daemon=True)
+        t.start()
+        _workers.append(t)
+
+def stop_workers():
+    _stop_event.set()
+    for t in _workers:
+        t.join(timeout=5)
+    _workers.clear()
+
+# 4. API CHO AGENT
+
+def enqueue_write(fname: str, call_args: dict, scope: str = None, wait: float = None) -> dict:
+    """
+    Đưa thao tác ghi vào hàng đợi, trả trạng thái cho model ngay.
+    call_args chứa "token" như khi gọi trực tiếp hàm trong tools.py.
+    scope: id của lượt chat hiện tại — lời gọi lặp lại trong cùng scope dùng chung một job.
+    Không truyền scope → mỗi lời gọi là một thao tác riêng.
+    """
+    user_token = call_args["token"]
+    key = make_idempotency_key(user_token, fname, call_args, scope or uuid.uuid4().hex)
+    now = time.time()
+    expires_at = token_expiry(user_token)
+    if expires_at and expires_at <= now:
+        return {"status": STATUS_FAILED, "idempotency_key": key, "result": {"error": TOKEN_EXPIRED_ERROR}}
+    job = {
+        "idempotency_key": key, "tool": fname, "args": call_args,
+        "user": hash_token(user_token), "status": STATUS_QUEUED,
+        "created_at": now, "updated_at": now, "request_id": uuid.uuid4().hex,
+        "token_expires_at": expires_at,
+    }
+    existing = store.reserve(key, job)
+    if existing and existing.get("status") == STATUS_FAILED:
+        # Lần trước lỗi → cho phép thử lại với cùng key
+        store.update(key, **job, result=None, delivered=False)
+        store.push(key)
+    elif existing:
+        return _status_for_model(key, existing, duplicate=True)
+
+    # Chờ ngắn: backend nhanh thì model nhận luôn kết quả (vd: id cuộc họp vừa tạo)
+    deadline = now + (WRITE_SYNC_WAIT if wait is None else wait)
+    while time.time() < deadline:
+        current = store.get(key)
+        if current and current.get("status") in (STATUS_CONFIRMED, STATUS_FAILED):
+            # Model đã nhận kết quả trực tiếp → không cần báo lại qua hộp thông báo
+            store.update(key, delivered=True)
+            return _status_for_model(key, current)
+        time.sleep(0.1)
+    return _status_for_model(key, store.get(key) or job)
+
+def _status_for_model(key: str, job: dict, duplicate: bool = False) -> dict:
+    status = job.get("status", STATUS_QUEUED)
+    reply = {"status": status, "idempotency_key": key}
+    if status in (STATUS_CONFIRMED, STATUS_FAILED):
+        reply["result"] = job.get("result")
+    else:
+        reply["message"] = "Yêu cầu đã được đưa vào hàng đợi xử lý. Kết quả sẽ được thông báo cho người dùng khi hoàn tất."
+    if duplicate:
+        reply["duplicate"] = True
+        reply["note"] = "Thao tác giống hệt đã được gửi trong lượt này, không tạo thêm yêu cầu mới."
+    return reply
+
+def get_write_status(user_token: str, key: str):
+    job = store.get(key)
+    if not job or job.get("user") != hash_token(user_token):
+        return None
+    return _status_for_model(key, job)
+
+def drain_write_outcomes(user_token: str):
+    """Lấy (và xóa) các kết quả ghi đã hoàn tất của user."""
+    try:
+        outcomes = store.drain_outcomes(hash_token(user_token))
+        return [o for o in outcomes if not (store.get(o["idempotency_key"]) or {}).get("delivered")]
+    except Exception as e:
+        print(f"[WARN] Cannot read write outcomes: {e}")
+        return []